@@ -20,14 +20,15 @@ Author: (ROHIT) Enhanced with Linux Mint Theme
 
 import os
 import sys
-import threading
 import time
 from tkinter import Tk, Frame, Label, Button, filedialog, LEFT, RIGHT, BOTTOM, TOP, BOTH, X, Y, YES, NW, SUNKEN, FLAT, GROOVE, RIDGE
 from tkinter import ttk
 from tkinter import messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
+from viewer_engine import ViewerEngine, tracer
 
 SUPPORTED_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tiff')
+FRAME_INTERVAL_MS = 16      # render requests are coalesced to at most one per frame (~60 fps)
 
 class ImageViewer:
     def __init__(self, root):
@@ -38,14 +39,18 @@ class ImageViewer:
 
         self.images = []          # list of file paths
         self.index = 0            # current index
-        self.img = None           # PIL Image
         self.tkimg = None         # PhotoImage for Tk
-        self.zoom = 1.0
-        self.angle = 0            # rotation
         self.slideshow = False
         self.slideshow_delay = 2.0  # seconds
+        self._slide_job = None
+        self._slide_due = 0.0       # perf_counter() deadline of the next slide
         self.is_fullscreen = False
 
+        # Bursts of resize/zoom/rotate requests collapse into one render per frame
+        self._frame_job = None
+        self._last_frame = 0.0
+        self.render_stats = {'requested': 0, 'rendered': 0, 'coalesced': 0}
+
         # Linux Mint Color Scheme
         self.mint_green = '#8fa876'       # Classic Mint green
         self.mint_green_dark = '#6b8e4e'  # Darker mint green
@@ -60,6 +65,11 @@ class ImageViewer:
         self.status_fg = '#3c3c3c'        # Status text
         self.border_color = '#c0c0c0'     # Subtle borders
 
+        # Decoding, rotation, scaling and caching happen in the engine; at zoom 1
+        # images larger than the window are shrunk to fit, smaller ones stay 1:1
+        self.engine = ViewerEngine(background=self.bg_color, thumbnails=False, metadata=False)
+        self.engine.upscale = False
+
         self.root.configure(bg=self.bg_color)
         
         self._build_ui()
@@ -179,6 +189,11 @@ class ImageViewer:
         self.image_label = Label(image_container, bg='#ffffff', anchor=NW)
         self.image_label.pack(fill=BOTH, expand=YES)
 
+        # Per-stage timing overlay (F12), placed over the image when shown
+        self.hud = Label(self.view_frame, bg='#000000', fg='#4ec9b0', font=('Courier', 9),
+                         justify=LEFT, anchor=NW, padx=8, pady=6)
+        self.hud_visible = False
+
         # Status bar with Mint styling
         status_frame = Frame(self.root, bg=self.status_bg, relief=FLAT, bd=1)
         status_frame.pack(side=BOTTOM, fill=X)
@@ -251,6 +266,8 @@ class ImageViewer:
         self.root.bind('<minus>', lambda e: self.zoom_by(0.8))
         self.root.bind('<Escape>', lambda e: self._exit_fullscreen_if())
         self.root.bind('<F11>', lambda e: self.toggle_fullscreen())
+        self.root.bind('<F12>', lambda e: self.toggle_hud())
+        self.root.bind('<Shift-F12>', lambda e: self.export_trace())
         self.root.bind('f', lambda e: self.fit_to_window())
         self.root.bind('o', lambda e: self.open_file())
         self.root.bind('<Control-o>', lambda e: self.open_folder())
@@ -307,41 +324,50 @@ class ImageViewer:
 
     def load_image(self, path):
         try:
-            img = Image.open(path)
+            with tracer.run('load', path=path):
+                entry = self.engine.decode(path, self._viewport())
+                self.engine.set_image(path, entry)
         except Exception as e:
             messagebox.showerror('Open error', f'Unable to open image:\n{e}')
             return
-        self.img = img.convert('RGBA') if img.mode in ('RGBA','LA') else img.convert('RGB')
-        self.zoom = 1.0
-        self.angle = 0
-        self._render()
+        self.engine.reset_view()
+        self.request_render()
         self._update_status()
 
-    def _render(self):
-        if self.img is None:
+    def request_render(self):
+        """Schedule a render; requests within the same display frame collapse into one"""
+        self.render_stats['requested'] += 1
+        if self._frame_job is not None:
+            self.render_stats['coalesced'] += 1
             return
-        # apply rotation
-        display = self.img.rotate(self.angle, expand=True)
-
-        # compute target size based on zoom and view_frame size
-        frame_w = max(100, self.view_frame.winfo_width())
-        frame_h = max(100, self.view_frame.winfo_height())
-        target_w = int(display.width * self.zoom)
-        target_h = int(display.height * self.zoom)
+        wait = FRAME_INTERVAL_MS - (time.perf_counter() - self._last_frame) * 1000
+        if wait > 0:
+            self._frame_job = self.root.after(int(wait) + 1, self._flush_render)
+        else:
+            self._frame_job = self.root.after_idle(self._flush_render)
 
-        # if image larger than frame and zoom == 1, fit to window
-        if self.zoom == 1.0 and (target_w > frame_w or target_h > frame_h):
-            ratio = min(frame_w / display.width, frame_h / display.height)
-            target_w = max(1, int(display.width * ratio))
-            target_h = max(1, int(display.height * ratio))
+    def _flush_render(self):
+        self._frame_job = None
+        self._last_frame = time.perf_counter()
+        self.render_stats['rendered'] += 1
+        self._render()
 
-        try:
-            resized = display.resize((target_w, target_h), Image.LANCZOS)
-        except Exception:
-            resized = display
+    def _viewport(self):
+        return max(100, self.view_frame.winfo_width()), max(100, self.view_frame.winfo_height())
 
-        self.tkimg = ImageTk.PhotoImage(resized)
-        self.image_label.config(image=self.tkimg)
+    def _render(self):
+        if self.engine.img is None:
+            return
+        with tracer.run('frame'):
+            frame = self.engine.render_frame(self._viewport())
+            with tracer.span('photoimage'):
+                # Only a new viewport size costs a fresh Tk image; otherwise update it in place
+                if self.tkimg is None or (self.tkimg.width(), self.tkimg.height()) != frame.size:
+                    self.tkimg = ImageTk.PhotoImage('RGB', frame.size)
+                    self.image_label.config(image=self.tkimg)
+                self.tkimg.paste(frame)
+        if self.hud_visible:
+            self.hud.config(text=self.engine.hud_text(self._hud_counters()))
 
     def _update_status(self):
         if not self.images:
@@ -351,9 +377,9 @@ class ImageViewer:
         fname = os.path.basename(path)
         info = (f'Image {self.index+1} of {len(self.images)}  •  '
                 f'{fname}  •  '
-                f'{self.img.width} × {self.img.height} px  •  '
-                f'Zoom: {self.zoom:.0%}  •  '
-                f'Rotation: {self.angle}°')
+                f'{self.engine.display_size[0]} × {self.engine.display_size[1]} px  •  '
+                f'Zoom: {self.engine.zoom:.0%}  •  '
+                f'Rotation: {self.engine.rotation}°')
         self.status.config(text=info)
 
     def prev_image(self):
@@ -369,35 +395,49 @@ class ImageViewer:
         self.load_image(self.images[self.index])
 
     def zoom_by(self, factor):
-        if self.img is None:
+        if self.engine.img is None:
             return
-        self.zoom *= factor
-        # clamp zoom
-        self.zoom = max(0.05, min(self.zoom, 20))
-        self._render()
+        self.engine.zoom_by(factor)
+        self.request_render()
         self._update_status()
 
     def fit_to_window(self):
-        if self.img is None:
+        if self.engine.img is None:
             return
-        # compute ratio to fit
-        frame_w = max(100, self.view_frame.winfo_width())
-        frame_h = max(100, self.view_frame.winfo_height())
-        
-        # Account for rotation
-        display = self.img.rotate(self.angle, expand=True)
-        ratio = min(frame_w / display.width, frame_h / display.height)
-        self.zoom = ratio
-        self._render()
+        # An explicit zoom level, so small images are enlarged too (rotation is accounted for)
+        self.engine.fit_mode = False
+        self.engine.zoom = self.engine.fit_scale(self._viewport())
+        self.request_render()
         self._update_status()
 
     def rotate(self, degrees):
-        if self.img is None:
+        if self.engine.img is None:
             return
-        self.angle = (self.angle + degrees) % 360
-        self._render()
+        self.engine.rotate(degrees)
+        self.request_render()
         self._update_status()
 
+    def toggle_hud(self):
+        self.hud_visible = not self.hud_visible
+        if self.hud_visible:
+            self.hud.config(text=self.engine.hud_text(self._hud_counters()))
+            self.hud.place(x=8, y=8)
+        else:
+            self.hud.place_forget()
+
+    def _hud_counters(self):
+        """Front-end counters shown under the engine's timings in the HUD"""
+        return {f'renders {name}': count for name, count in self.render_stats.items()}
+
+    def export_trace(self):
+        """Save the recorded per-stage timings for offline profiling"""
+        path = filedialog.asksaveasfilename(
+            title='Export trace', defaultextension='.json',
+            filetypes=[('Chrome trace (chrome://tracing, Perfetto)', '*.json'), ('JSON lines', '*.jsonl')])
+        if path:
+            count = tracer.export(path)
+            self.status.config(text=f'Trace: {count} spans written to {path}')
+
     def toggle_fullscreen(self):
         self.is_fullscreen = not self.is_fullscreen
         self.root.attributes('-fullscreen', self.is_fullscreen)
@@ -415,19 +455,29 @@ class ImageViewer:
         # Update button text
         if self.slideshow:
             self.slideshow_btn.config(text='⏸ Pause')
-            threading.Thread(target=self._slideshow_loop, daemon=True).start()
+            self._slide_due = time.perf_counter() + self.slideshow_delay
+            self._schedule_slide()
         else:
             self.slideshow_btn.config(text='▶ Slideshow')
-
-    def _slideshow_loop(self):
-        while self.slideshow:
-            time.sleep(self.slideshow_delay)
-            if not self.slideshow:
-                break
-            # advance
-            self.index = (self.index + 1) % len(self.images)
-            # load on main thread via after
-            self.root.after(0, lambda: self.load_image(self.images[self.index]))
+            if self._slide_job is not None:
+                self.root.after_cancel(self._slide_job)
+                self._slide_job = None
+
+    def _schedule_slide(self):
+        delay = max(0.0, self._slide_due - time.perf_counter())
+        self._slide_job = self.root.after(round(delay * 1000), self._advance_slide)
+
+    def _advance_slide(self):
+        """Show the next slide on the Tk thread; deadlines advance by the delay so lateness never accumulates"""
+        self._slide_job = None
+        if not self.slideshow or not self.images:
+            return
+        self._slide_due += self.slideshow_delay
+        if self._slide_due < time.perf_counter():
+            self._slide_due = time.perf_counter() + self.slideshow_delay
+        self.index = (self.index + 1) % len(self.images)
+        self.load_image(self.images[self.index])
+        self._schedule_slide()
 
 
 if __name__ == '__main__':
@@ -438,11 +488,11 @@ if __name__ == '__main__':
     last_size = [0, 0]
     def on_resize(event):
         # Only re-render if size actually changed and we have an image
-        if app.img is not None:
+        if app.engine.img is not None:
             current_size = [app.view_frame.winfo_width(), app.view_frame.winfo_height()]
             if current_size != last_size:
                 last_size[0], last_size[1] = current_size
-                app._render()
+                app.request_render()
     
     root.bind('<Configure>', on_resize)
     root.mainloop()
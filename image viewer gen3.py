@@ -11,16 +11,98 @@ Features:
 - Status bar with detailed info
 """
 
+import argparse
 import os
-import sys
-import threading
+import queue
+import random
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import Tk, Frame, Label, Button, filedialog, LEFT, RIGHT, BOTTOM, TOP, BOTH, X, Y, YES, NW, FLAT
-from tkinter import messagebox, Canvas
+from tkinter import messagebox, Canvas, Scrollbar, HORIZONTAL, VERTICAL
 from PIL import Image, ImageTk, ImageDraw, ImageFilter
 import tkinter.font as tkFont
 
-SUPPORTED_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tiff', '.ico')
+from viewer_engine import (SUPPORTED_EXTS, PREFETCH_AHEAD, PREFETCH_BEHIND, THUMBNAIL_SIZES, MAX_CACHE_MB,
+                           LOW_MEMORY_MB, ImageList, FolderScanner, FolderWatcher, ViewerEngine, AnimationPlayer,
+                           available_memory, decode_image, image_nbytes, fit_frame, orient, transition_frames,
+                           tracer)
+
+DECODE_POLL_MS = 15         # how often a pending foreground decode is checked
+
+# Thumbnail grid / filmstrip
+GRID_CELL = 168             # grid cell size in pixels, thumbnail plus padding
+FILMSTRIP_CELL = 96
+BROWSER_WORKERS = 2
+BROWSER_POLL_MS = 30
+BROWSER_OVERSCAN = 1        # rows (or filmstrip cells) prepared beyond the visible area
+
+PAN_STEP = 0.1              # fraction of the viewport moved per keyboard pan
+
+# Progressive rendering: cheap filter while interacting, LANCZOS once input is idle
+REFINE_DELAY_MS = 150       # idle time before the high-quality pass starts
+REFINE_SLICE_S = 0.012      # time spent on high-quality tiles before yielding to Tk
+FRAME_INTERVAL_MS = 16      # render requests are coalesced to at most one per frame (~60 fps)
+
+MEMORY_POLL_MS = 2000        # how often the OS is asked how much memory is left
+SCAN_POLL_MS = 30
+WATCH_POLL_MS = 250         # how often changes seen by the FolderWatcher are applied
+
+# Navigation: requests closer together than this count as skimming (e.g. a held arrow key);
+# only cached previews are shown until the user settles on an image
+NAV_SETTLE_MS = 120
+
+FREE_ROTATE_STEP = 1        # degrees per free-rotation key press
+
+# Sorting and filtering by indexed metadata; views are rebuilt as the index fills in
+INDEX_POLL_MS = 500
+SORT_ORDERS = ('name', 'date taken', 'file size', 'resolution')
+ASPECT_FILTERS = {
+    'all': None,
+    'landscape': lambda ratio: ratio > 1.05,
+    'portrait': lambda ratio: ratio < 0.95,
+    'square': lambda ratio: 0.95 <= ratio <= 1.05,
+    'panorama': lambda ratio: ratio >= 2 or ratio <= 0.5,
+}
+
+# Slideshow: slides advance on fixed deadlines; the next one is decoded while the current shows
+SLIDESHOW_JITTER_SAMPLES = 100  # per-slide lateness values kept for slideshow_jitter
+TRANSITIONS = ('none', 'crossfade', 'slide')
+TRANSITION_MS = 400
+TRANSITION_FPS = 25
+TRANSITION_LEAD_S = 1.0     # transition frames are computed this long before the slide is due
+
+
+class DisplaySurface:
+    """Keeps one frame buffer and Tk PhotoImage per viewport size and updates them in place"""
+    def __init__(self, canvas, item, background):
+        self.canvas = canvas
+        self.item = item
+        self.background = background
+        self.frame = None
+        self.photo = None
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.presents = 0
+
+    def begin(self, size):
+        """Frame buffer for this viewport size, cleared to the background"""
+        if self.frame is None or self.frame.size != size:
+            # Only a new viewport size costs a fresh frame and Tk image
+            self.frame = Image.new('RGB', size, self.background)
+            self.photo = ImageTk.PhotoImage('RGB', size)
+            self.canvas.itemconfig(self.item, image=self.photo)
+            self.allocations += 1
+            self.allocated_bytes += 2 * image_nbytes(self.frame)
+        else:
+            self.frame.paste(self.background, (0, 0) + size)
+        return self.frame
+
+    def present(self):
+        self.photo.paste(self.frame)
+        self.presents += 1
+
+
 
 class ModernButton(Frame):
     """Custom modern button with hover effects"""
@@ -64,23 +146,248 @@ class ModernButton(Frame):
             self.command()
 
 
+class ThumbnailBrowser(Frame):
+    """Virtualized thumbnail grid, or a single-row filmstrip, over the viewer's image list.
+
+    Only cells inside the scrolled-to window get canvas items and decoded
+    thumbnails; items are recycled as they scroll out, so widget count and
+    memory stay constant however large the folder is.
+    """
+    def __init__(self, parent, viewer, filmstrip=False):
+        super().__init__(parent, bg=viewer.bg_darker)
+        self.viewer = viewer
+        self.filmstrip = filmstrip
+        self.cell = FILMSTRIP_CELL if filmstrip else GRID_CELL
+        self.canvas = Canvas(self, bg=viewer.bg_darker, highlightthickness=0, bd=0,
+                             xscrollincrement=self.cell // 2, yscrollincrement=self.cell // 2)
+        self.scrollbar = Scrollbar(self, orient=HORIZONTAL if filmstrip else VERTICAL,
+                                   command=self._on_scroll)
+        if filmstrip:
+            self.canvas.config(height=self.cell, xscrollcommand=self.scrollbar.set)
+            self.scrollbar.pack(side=BOTTOM, fill=X)
+            self.canvas.pack(side=TOP, fill=X)
+        else:
+            self.canvas.config(yscrollcommand=self.scrollbar.set)
+            self.scrollbar.pack(side=RIGHT, fill=Y)
+            self.canvas.pack(side=LEFT, fill=BOTH, expand=YES)
+
+        self.cells = {}             # index -> (image item, outline item)
+        self.free = []              # recycled item pairs
+        self.photos = OrderedDict() # path -> PhotoImage, LRU bounded by a few screens
+        self.failed = set()
+        self.pending = {}           # path -> Future of a worker thumbnail load
+        self.results = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=BROWSER_WORKERS, thread_name_prefix='browser')
+        self._poll_job = None
+
+        self.canvas.bind('<Configure>', lambda e: self.refresh())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', lambda e: self._scroll(-1 if e.delta > 0 else 1))
+        self.canvas.bind('<Button-4>', lambda e: self._scroll(-1))
+        self.canvas.bind('<Button-5>', lambda e: self._scroll(1))
+
+    def _columns(self):
+        if self.filmstrip:
+            return max(1, len(self.viewer.images))
+        return max(1, self.canvas.winfo_width() // self.cell)
+
+    def _position(self, index, columns):
+        row, col = divmod(index, columns)
+        return col * self.cell, row * self.cell
+
+    def refresh(self):
+        """Lay out the cells in view for the current scroll position"""
+        count = len(self.viewer.images)
+        columns = self._columns()
+        rows = -(-count // columns)
+        self.canvas.config(scrollregion=(0, 0, columns * self.cell, rows * self.cell))
+
+        # Index range under the scroll window, plus a little overscan
+        left, top = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        if self.filmstrip:
+            first = int(left // self.cell) - BROWSER_OVERSCAN
+            last = int((left + self.canvas.winfo_width()) // self.cell) + BROWSER_OVERSCAN
+        else:
+            first = (int(top // self.cell) - BROWSER_OVERSCAN) * columns
+            last = (int((top + self.canvas.winfo_height()) // self.cell) + 1 + BROWSER_OVERSCAN) * columns - 1
+        visible = range(max(0, first), min(count - 1, last) + 1)
+
+        for index in [i for i in self.cells if i not in visible]:
+            image_item, outline_item = self.cells.pop(index)
+            self.canvas.itemconfig(image_item, image='', state='hidden')
+            self.canvas.itemconfig(outline_item, state='hidden')
+            self.free.append((image_item, outline_item))
+
+        wanted = []
+        for index in visible:
+            path = self.viewer.images[index]
+            items = self.cells.get(index)
+            if items is None:
+                items = self.free.pop() if self.free else (
+                    self.canvas.create_image(0, 0),
+                    self.canvas.create_rectangle(0, 0, 0, 0, width=2))
+                self.cells[index] = items
+            image_item, outline_item = items
+            x, y = self._position(index, columns)
+            pad = 3
+            self.canvas.coords(image_item, x + self.cell / 2, y + self.cell / 2)
+            self.canvas.coords(outline_item, x + pad, y + pad, x + self.cell - pad, y + self.cell - pad)
+            photo = self.photos.get(path)
+            if photo is not None:
+                self.photos.move_to_end(path)
+            elif path not in self.failed:
+                wanted.append(path)
+            self.canvas.itemconfig(image_item, image=photo or '', state='normal')
+            self.canvas.itemconfig(outline_item, state='normal',
+                                   outline=self.viewer.accent if index == self.viewer.index else self.viewer.bg_darker)
+        self._request(wanted)
+
+    def _request(self, paths):
+        """Load thumbnails for visible cells, cancelling loads for cells scrolled away"""
+        wanted = set(paths)
+        for path, future in list(self.pending.items()):
+            if path not in wanted and future.cancel():
+                del self.pending[path]
+        for path in paths:
+            if path not in self.pending:
+                self.pending[path] = self._pool.submit(self._load, path)
+        if self.pending and self._poll_job is None:
+            self._poll_job = self.after(BROWSER_POLL_MS, self._poll)
+
+    def _load(self, path):
+        """Worker: thumbnail scaled to the cell, from the disk cache or a reduced decode"""
+        size = self.cell - 8
+        try:
+            entry = self.viewer.engine.thumbnails.lookup(path, min_size=size)
+            if entry is None:
+                entry = decode_image(path, (THUMBNAIL_SIZES['x-large'],) * 2)
+                self.viewer.engine.thumbnails.generate(path, entry)
+            img = entry.image
+            ratio = min(1.0, size / max(img.size))
+            img = img.resize((max(1, round(img.width * ratio)), max(1, round(img.height * ratio))),
+                             Image.LANCZOS)
+            img = orient(img, entry.orientation)  # stored thumbnails are upright already
+        except Exception:
+            img = None
+        self.results.put((path, img))
+
+    def _poll(self):
+        self._poll_job = None
+        loaded = False
+        while True:
+            try:
+                path, img = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.pop(path, None)
+            if img is None:
+                self.failed.add(path)
+                continue
+            self.photos[path] = ImageTk.PhotoImage(img)
+            loaded = True
+        # Keep a few screens' worth of thumbnails, not the whole folder
+        while len(self.photos) > max(64, 3 * len(self.cells)):
+            self.photos.popitem(last=False)
+        if loaded:
+            self.refresh()
+        if self.pending and self._poll_job is None:
+            self._poll_job = self.after(BROWSER_POLL_MS, self._poll)
+
+    def show_index(self, index):
+        """Scroll just enough to bring a cell into view, then redraw"""
+        count = len(self.viewer.images)
+        if count:
+            columns = self._columns()
+            x, y = self._position(index, columns)
+            if self.filmstrip:
+                left, span, pos, total = self.canvas.canvasx(0), self.canvas.winfo_width(), x, count * self.cell
+                if pos < left or pos + self.cell > left + span:
+                    self.canvas.xview_moveto(max(0, pos + self.cell / 2 - span / 2) / total)
+            else:
+                top, span, pos, total = self.canvas.canvasy(0), self.canvas.winfo_height(), y, -(-count // columns) * self.cell
+                if pos < top or pos + self.cell > top + span:
+                    self.canvas.yview_moveto(max(0, pos + self.cell / 2 - span / 2) / total)
+        self.refresh()
+
+    def _on_scroll(self, *args):
+        (self.canvas.xview if self.filmstrip else self.canvas.yview)(*args)
+        self.refresh()
+
+    def _scroll(self, units):
+        (self.canvas.xview_scroll if self.filmstrip else self.canvas.yview_scroll)(units, 'units')
+        self.refresh()
+        return 'break'  # keep the wheel from zooming the image behind
+
+    def _on_click(self, event):
+        columns = self._columns()
+        col = int(self.canvas.canvasx(event.x) // self.cell)
+        row = int(self.canvas.canvasy(event.y) // self.cell)
+        index = col if self.filmstrip else row * columns + col
+        if col < columns and 0 <= index < len(self.viewer.images):
+            self.viewer.go_to(index)
+            if not self.filmstrip:
+                self.viewer.toggle_grid()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 class ImageViewer:
-    def __init__(self, root):
+    def __init__(self, root, max_cache_mb=MAX_CACHE_MB):
         self.root = root
         self.root.title('Image Viewer Pro made by nishu ')
         self.root.geometry('1200x800')
         self.root.minsize(800, 600)
 
-        self.images = []
+        self.all_images = ImageList()  # everything scanned, in name order
+        self.images = self.all_images  # what navigation walks: all_images, or a sorted/filtered view
         self.index = 0
-        self.img = None
-        self.tkimg = None
-        self.zoom = 1.0
-        self.angle = 0
+        self.scanner = None       # FolderScanner still streaming into self.images
+        self.watcher = None       # FolderWatcher on the open folder
+        self.sort_order = 'name'
+        self.aspect_filter = 'all'
+        self._index_version = None
         self.slideshow = False
         self.slideshow_delay = 3.0
+        self.slideshow_shuffle = False
+        self.slideshow_loop = True
+        self.slideshow_jitter = deque(maxlen=SLIDESHOW_JITTER_SAMPLES)  # ms each slide was late
+        self._slide_due = 0.0
+        self._slide_job = None
+        self._next_slide = None
+        self._next_slide_future = None
+        self._shuffle_order = None  # remaining paths of the current shuffled pass
+        self.slideshow_transition = 'none'
+        self._transition_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transition')
+        self._transition_job = None
+        self._transition_future = None
+        self._transition_gen = None  # render generation the transition's first frame came from
         self.is_fullscreen = False
-        self.fit_mode = True  # Auto-fit by default
+
+        # Neighbours decoded in the background into the engine's cache
+        self.prefetch_ahead = PREFETCH_AHEAD
+        self.prefetch_behind = PREFETCH_BEHIND
+        self._reported_bytes = 0
+        self.animation = None       # AnimationPlayer while an animated image is shown
+        self._drag_start = None
+
+        # Two-pass render scheduling; a newer request makes pending refinement stale
+        self.refine_delay_ms = REFINE_DELAY_MS
+        self._render_gen = 0
+        self._refine_job = None
+        self._redecode_job = None
+
+        # Bursts of resize/zoom/rotate/pan requests collapse into one render per frame
+        self._frame_job = None
+        self._frame_interactive = True
+        self._last_frame = 0.0
+        self.render_stats = {'requested': 0, 'rendered': 0, 'coalesced': 0}
+
+        # Latest-wins navigation; decodes for images skipped past are dropped
+        self._nav_gen = 0
+        self._settle_job = None
+        self._last_nav = 0.0
+        self.nav_stats = {'requested': 0, 'settled': 0, 'discarded': 0}
 
         # Professional Dark Theme Colors
         self.bg_dark = '#1e1e1e'           # Main background
@@ -95,6 +402,11 @@ class ImageViewer:
         self.border = '#3e3e3e'            # Border color
         self.success = '#4ec9b0'           # Success/active color
         self.warning = '#dcdcaa'           # Warning color
+
+        # Decoding, caches and the view state (zoom, rotation, pan) live in the engine;
+        # this class only turns input into engine calls and puts frames on screen
+        self.engine = ViewerEngine(max_cache_mb, background=self.bg_darker)
+        self.engine.screen = (self.root.winfo_screenwidth(), self.root.winfo_screenheight())
         
         self.root.configure(bg=self.bg_dark)
         
@@ -108,8 +420,39 @@ class ImageViewer:
             self.font_bold = tkFont.Font(family='Arial', size=9, weight='bold')
             self.font_status = tkFont.Font(family='Courier', size=9)
         
+        self.trace_path = None      # spans are written here on close (--trace)
+
         self._build_ui()
         self._bind_shortcuts()
+        self.root.protocol('WM_DELETE_WINDOW', self.on_close)
+        self._watch_memory()
+        self._poll_index()
+
+    def _watch_memory(self):
+        """Give memory back when the OS runs low, and keep the status bar's usage current"""
+        available = available_memory()
+        low = LOW_MEMORY_MB * 1024 * 1024
+        if available is not None and available < low:
+            self.engine.memory.trim(max(0, self.engine.memory.nbytes - (low - available)))
+        if self.engine.img is not None and self.engine.memory.nbytes != self._reported_bytes:
+            self._update_status()
+        self.root.after(MEMORY_POLL_MS, self._watch_memory)
+
+    def on_close(self):
+        self.slideshow = False
+        if self.scanner is not None:
+            self.scanner.cancel()
+        if self.watcher is not None:
+            self.watcher.cancel()
+        self.engine.shutdown()
+        self._transition_pool.shutdown(wait=False, cancel_futures=True)
+        self.filmstrip.shutdown()
+        self.grid.shutdown()
+        if self.animation is not None:
+            self.animation.stop()
+        if self.trace_path:
+            tracer.export(self.trace_path)
+        self.root.destroy()
 
     def _build_ui(self):
         # Top toolbar
@@ -199,6 +542,14 @@ class ImageViewer:
                     bg=self.bg_lighter, hover_bg=self.accent_hover,
                     fg=self.text_primary).pack(side=LEFT, padx=1)
 
+        ModernButton(play_frame, '  ▦ Grid  ', self.toggle_grid,
+                    bg=self.bg_lighter, hover_bg=self.accent_hover,
+                    fg=self.text_primary).pack(side=LEFT, padx=1)
+
+        ModernButton(play_frame, '  ▭ Filmstrip  ', self.toggle_filmstrip,
+                    bg=self.bg_lighter, hover_bg=self.accent_hover,
+                    fg=self.text_primary).pack(side=LEFT, padx=1)
+
         # Main viewing area with border
         self.view_frame = Frame(self.root, bg=self.bg_dark)
         self.view_frame.pack(fill=BOTH, expand=YES, padx=10, pady=5)
@@ -207,9 +558,24 @@ class ImageViewer:
         image_container = Frame(self.view_frame, bg=self.bg_darker, 
                                highlightbackground=self.border, highlightthickness=1)
         image_container.pack(fill=BOTH, expand=YES)
+        self.image_container = image_container
+
+        # Thumbnail browsers (hidden until toggled)
+        self.filmstrip = ThumbnailBrowser(self.view_frame, self, filmstrip=True)
+        self.grid = ThumbnailBrowser(self.view_frame, self)
+        self.filmstrip_visible = False
+        self.grid_visible = False
+
+        # Only the visible part of the image is ever resampled onto this canvas
+        self.canvas = Canvas(image_container, bg=self.bg_darker, highlightthickness=0, bd=0)
+        self.canvas.pack(fill=BOTH, expand=YES)
+        self.canvas_image = self.canvas.create_image(0, 0, anchor=NW)
+        self.surface = DisplaySurface(self.canvas, self.canvas_image, self.bg_darker)
 
-        self.image_label = Label(image_container, bg=self.bg_darker, anchor='center')
-        self.image_label.pack(fill=BOTH, expand=YES)
+        # Per-stage timing overlay (F12)
+        self.hud = Label(image_container, bg='#000000', fg=self.success, font=self.font_status,
+                         justify=LEFT, anchor=NW, padx=8, pady=6)
+        self.hud_visible = False
 
         # Status bar
         status_frame = Frame(self.root, bg=self.toolbar_bg, height=30)
@@ -239,14 +605,33 @@ class ImageViewer:
         self.root.bind('<minus>', lambda e: self.zoom_by(0.8))
         self.root.bind('<Escape>', lambda e: self._exit_fullscreen_if())
         self.root.bind('<F11>', lambda e: self.toggle_fullscreen())
+        self.root.bind('<F12>', lambda e: self.toggle_hud())
+        self.root.bind('<Shift-F12>', lambda e: self.export_trace())
         self.root.bind('f', lambda e: self.fit_to_window())
         self.root.bind('o', lambda e: self.open_file())
         self.root.bind('<Control-o>', lambda e: self.open_folder())
         self.root.bind('r', lambda e: self.rotate(90))
+        self.root.bind('g', lambda e: self.toggle_grid())
+        self.root.bind('t', lambda e: self.toggle_filmstrip())
+        self.root.bind('<bracketleft>', lambda e: self.rotate_fine(FREE_ROTATE_STEP))
+        self.root.bind('<bracketright>', lambda e: self.rotate_fine(-FREE_ROTATE_STEP))
         self.root.bind('<space>', lambda e: self.toggle_slideshow())
+        self.root.bind('s', lambda e: self.toggle_shuffle())
+        self.root.bind('l', lambda e: self.toggle_loop())
+        self.root.bind('x', lambda e: self.cycle_transition())
+        self.root.bind('n', lambda e: self.cycle_sort())
+        self.root.bind('a', lambda e: self.cycle_aspect_filter())
         self.root.bind('<MouseWheel>', self._on_mousewheel)
         self.root.bind('<Button-4>', lambda e: self.zoom_by(1.15))
         self.root.bind('<Button-5>', lambda e: self.zoom_by(0.85))
+        # Panning: drag with the mouse or Shift+arrows
+        self.canvas.bind('<ButtonPress-1>', self._on_drag_start)
+        self.canvas.bind('<B1-Motion>', self._on_drag)
+        self.canvas.bind('<ButtonRelease-1>', self._on_drag_end)
+        self.root.bind('<Shift-Left>', lambda e: self.pan_by(-PAN_STEP, 0))
+        self.root.bind('<Shift-Right>', lambda e: self.pan_by(PAN_STEP, 0))
+        self.root.bind('<Shift-Up>', lambda e: self.pan_by(0, -PAN_STEP))
+        self.root.bind('<Shift-Down>', lambda e: self.pan_by(0, PAN_STEP))
 
     def _on_mousewheel(self, event):
         if event.delta > 0:
@@ -270,22 +655,13 @@ class ImageViewer:
         if not path:
             return
         
-        folder = os.path.dirname(path)
-        files = sorted([os.path.join(folder, f) for f in os.listdir(folder) 
-                       if f.lower().endswith(SUPPORTED_EXTS)])
-        
-        if files:
-            try:
-                self.index = files.index(path)
-                self.images = files
-            except ValueError:
-                self.images = [path]
-                self.index = 0
-        else:
-            self.images = [path]
-            self.index = 0
-        
-        self.load_image(self.images[self.index])
+        # Show the chosen file right away; its siblings stream in behind it
+        path = os.path.normpath(path)
+        self.all_images = self.images = ImageList([path])
+        self.index = 0
+        self._apply_view()  # the sort order and filter carry over to the new folder
+        self._start_scan(os.path.dirname(path))
+        self.load_image(path)
         self.indicator.config(fg=self.success)
 
     def open_folder(self):
@@ -293,67 +669,390 @@ class ImageViewer:
         if not folder:
             return
         
-        files = sorted([os.path.join(folder, f) for f in os.listdir(folder) 
-                       if f.lower().endswith(SUPPORTED_EXTS)])
-        
-        if not files:
+        # The first batch of the scan brings up the first image; the old one
+        # must not stay up, as the folder may turn out to have none
+        self.all_images = self.images = ImageList()
+        self.index = 0
+        self._apply_view()
+        if self.engine.img is not None:
+            self._clear_view()
+        self._start_scan(os.path.normpath(folder))
+
+    def _start_scan(self, folder):
+        if self.scanner is not None:
+            self.scanner.cancel()
+        if self.watcher is not None:
+            self.watcher.cancel()
+        self.engine.metadata.open_folder(folder)
+        # Watch before listing, so nothing written during the scan is missed
+        self.watcher = FolderWatcher(folder)
+        self.root.after(WATCH_POLL_MS, self._poll_watch, self.watcher)
+        self.scanner = FolderScanner(folder)
+        self._poll_scan(self.scanner)
+
+    def _poll_scan(self, scanner):
+        if scanner is not self.scanner:
+            return
+        found = []
+        finished = False
+        while True:
+            try:
+                batch = scanner.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                finished = True
+                break
+            found.extend(batch)
+        if finished:
+            self.scanner = None
+            self.engine.metadata.prune(self.all_images)
+        if found:
+            self._add_images(found)
+        elif finished and self.images:
+            self._update_status()
+        if not finished:
+            self.root.after(SCAN_POLL_MS, self._poll_scan, scanner)
+        elif not self.images:
             messagebox.showinfo('No Images Found', 
                               'No supported image files found in the selected folder.\n\n' +
                               'Supported formats: ' + ', '.join(SUPPORTED_EXTS),
                               icon='info')
+
+    def _add_images(self, paths):
+        """Merge newly found paths, keeping the current image where it is"""
+        self._apply_changes(paths, ())
+
+    def _poll_watch(self, watcher):
+        """Apply the adds, removes and renames the FolderWatcher saw since the last poll"""
+        if watcher is not self.watcher:
             return
-        
-        self.images = files
-        self.index = 0
-        self.load_image(self.images[self.index])
-        self.indicator.config(fg=self.success)
+        added, removed, renamed = {}, {}, {}
+        while True:
+            try:
+                kind, path, new_path = watcher.changes.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'overflow':
+                # Events were lost; a fresh listing picks up what was added meanwhile
+                if self.scanner is None:
+                    self.scanner = FolderScanner(watcher.folder)
+                    self._poll_scan(self.scanner)
+                continue
+            if kind in ('removed', 'renamed'):
+                added.pop(path, None)
+                removed[path] = None
+            if kind == 'removed':
+                # A file renamed and then deleted in the same batch is just deleted
+                renamed = {old: new for old, new in renamed.items() if new != path}
+            if kind == 'renamed':
+                for old, new in renamed.items():
+                    if new == path:
+                        renamed[old] = new_path  # renamed again
+                renamed[path] = path = new_path
+            if kind in ('added', 'renamed'):
+                removed.pop(path, None)
+                added[path] = None
+        if added or removed:
+            current = self.images[self.index] if self.images else None
+            rewritten = [path for path in added if self.all_images.index_of(path) is not None]
+            for path in rewritten:
+                self.engine.forget(path)  # stale pixels; the metadata index revalidates by mtime
+            self._apply_changes(list(added), list(removed), renamed)
+            if current in rewritten and self.images and self.images[self.index] == current:
+                self.load_image(current)
+        self.root.after(WATCH_POLL_MS, self._poll_watch, watcher)
+
+    def _apply_changes(self, added, removed, renamed=None):
+        """Merge added paths and drop removed ones incrementally, keeping the current image selected.
+
+        When the current image is removed, a rename is followed to the new name;
+        a deleted image is replaced by the one that came after it.
+        """
+        renamed = renamed or {}
+        current = self.images[self.index] if self.images else None
+        target = current
+        if current is not None and current in removed:
+            target = renamed.get(current) or self._successor(set(removed))
+        if removed:
+            for old, new in renamed.items():
+                # A renamed file decodes to the same pixels
+                entry = self.engine.cache.get(old)
+                if entry is not None:
+                    self.engine.cache.put(new, entry)
+            for path in removed:
+                self.engine.forget(path, deleted=path not in renamed)
+            self.all_images.remove(removed)
+            if self.images is not self.all_images:
+                self.images.remove(removed)
+            self.engine.metadata.remove(removed)
+        if added:
+            self.all_images.merge(added)
+            self.engine.metadata.update(added)
+            if self.images is not self.all_images:
+                self.images.merge([path for path in added if path == target or self._accepts(path)])
+
+        if not self.images:
+            self.index = 0
+            self._sync_slideshow()
+            if current is not None:
+                self._clear_view()
+            return
+        if target is None:
+            self.index = 0
+            self.load_image(self.images[0])
+            self.indicator.config(fg=self.success)
+            return
+        self.index = self.images.index_of(target)
+        self._sync_slideshow()
+        if target != current:
+            self.load_image(target)
+            return
+        if self.engine.img is not None:
+            self._update_status()
+        self._prefetch_neighbours()
+        self._refresh_browsers()
+
+    def _successor(self, removed):
+        """First image after the current one that survives removing `removed`, wrapping around"""
+        paths = self.images.paths
+        for path in paths[self.index + 1:] + paths[:self.index]:
+            if path not in removed:
+                return path
+        return None
+
+    def _clear_view(self):
+        """Blank the viewer after the last image in the folder went away"""
+        self._nav_gen += 1  # a decode still on its way must not bring the old image back
+        if self.animation is not None:
+            self.animation.stop()
+            self.animation = None
+        self.engine.close_image()
+        if self.surface.frame is not None:
+            self.surface.begin(self.surface.frame.size)
+            self.surface.present()
+        self._update_status()
+        self._refresh_browsers()
 
     def load_image(self, path):
-        try:
-            img = Image.open(path)
-        except Exception as e:
-            messagebox.showerror('Error Loading Image', 
-                               f'Unable to open the selected image:\n\n{str(e)}',
-                               icon='error')
+        """Show path now from whatever is cheap, and decode it once navigation settles.
+
+        Every call starts a new navigation generation, so work still pending for
+        an earlier request is discarded rather than replayed.
+        """
+        self._nav_gen += 1
+        self.nav_stats['requested'] += 1
+        if self._settle_job is not None:
+            self.root.after_cancel(self._settle_job)
+            self._settle_job = None
+        now = time.perf_counter()
+        skimming = now - self._last_nav < NAV_SETTLE_MS / 1000
+        self._last_nav = now
+
+        # Prefetched images come straight from the cache; otherwise a stored
+        # thumbnail is an instant first frame that the real decode replaces
+        with tracer.run('load', path=path):
+            with tracer.span('cache'):
+                entry = self.engine.cache.get(path)
+            if entry is not None:
+                self._show_image(path, entry)
+            else:
+                with tracer.span('thumbnail'):
+                    preview = self.engine.thumbnails.lookup(path)
+                if preview is not None:
+                    self._show_image(path, preview, preview=True)
+                else:
+                    self._update_status()  # keep the old frame up, but name the new image
+                    self._refresh_browsers(follow=True)
+
+        if skimming:
+            self._settle_job = self.root.after(NAV_SETTLE_MS, self._settle, path, self._nav_gen)
+        else:
+            self._settle(path, self._nav_gen)
+
+    def _settle(self, path, gen):
+        """Decode the image navigation stopped on and prefetch around it"""
+        self._settle_job = None
+        if gen != self._nav_gen:
             return
-        
-        self.img = img.convert('RGBA') if img.mode in ('RGBA', 'LA', 'P') else img.convert('RGB')
-        self.zoom = 1.0
-        self.angle = 0
-        self.fit_mode = True
-        self._render()
+        self.nav_stats['settled'] += 1
+        # Current image first; this also drops queued decodes for skipped images
+        self._prefetch_neighbours()
+        if path == self.engine.img_path and not self.engine.img_preview:
+            return
+        self._await_decode(path, self.engine.prefetcher.decode(path, self._viewport()), gen)
+
+    def _show_image(self, path, entry, preview=False):
+        self._set_image(path, entry, preview)
+        self.engine.reset_view()
+        self.request_render(interactive=False)
         self._update_status()
+        self._refresh_browsers(follow=True)
 
-    def _render(self):
-        if self.img is None:
+    def _await_decode(self, path, future, gen):
+        """Show the real decode of path once the worker has finished, unless navigation moved on"""
+        if gen != self._nav_gen:
+            self.nav_stats['discarded'] += 1
             return
-        
-        # Apply rotation
-        display = self.img.rotate(self.angle, expand=True, resample=Image.BICUBIC)
+        if not future.done():
+            self.root.after(DECODE_POLL_MS, self._await_decode, path, future, gen)
+            return
+        entry = self.engine.cache.get(path)
+        if entry is None:
+            # The background decode failed or was dropped; retry here to report the error
+            try:
+                entry = self.engine.decode(path, self._viewport())
+            except Exception as e:
+                if not os.path.exists(path):
+                    # Deleted before the watcher reported it: drop it and move on quietly
+                    self._apply_changes((), [path])
+                    return
+                messagebox.showerror('Error Loading Image', 
+                                   f'Unable to open the selected image:\n\n{str(e)}',
+                                   icon='error')
+                return
+        if path == self.engine.img_path:
+            self._set_image(path, entry)
+            self.request_render(interactive=False)
+            self._update_status()
+        else:
+            self._show_image(path, entry)
 
-        # Get frame dimensions
-        frame_w = max(100, self.view_frame.winfo_width() - 20)
-        frame_h = max(100, self.view_frame.winfo_height() - 20)
-        
-        # Calculate target size
-        if self.fit_mode:
-            # Fit to window
-            ratio = min(frame_w / display.width, frame_h / display.height)
-            target_w = max(1, int(display.width * ratio))
-            target_h = max(1, int(display.height * ratio))
+    def _prefetch_neighbours(self):
+        count = len(self.images)
+        if not count:
+            return
+        # The current image first (it may still be a preview), then interleave
+        # ahead/behind so the nearest neighbours are decoded first
+        order = [self.index]
+        for step in range(1, max(self.prefetch_ahead, self.prefetch_behind) + 1):
+            if step <= self.prefetch_ahead:
+                order.append((self.index + step) % count)
+            if step <= self.prefetch_behind:
+                order.append((self.index - step) % count)
+        paths = [self.images[i] for i in dict.fromkeys(order)]
+        if self.slideshow and self._next_slide is not None:
+            paths.insert(1, self._next_slide)  # right after the current image
+        self.engine.prefetcher.request(list(dict.fromkeys(paths)), self._viewport())
+
+    def _set_image(self, path, entry, preview=False):
+        self.engine.set_image(path, entry, preview)
+        if self.animation is not None and self.animation.path != path:
+            self.animation.stop()
+            self.animation = None
+        if entry.animated and self.animation is None:
+            self.animation = AnimationPlayer(self.root, path, self._show_frame, self.bg_darker)
+
+    def _viewport(self):
+        """Size available for the image; the screen size until the window is mapped"""
+        if self.canvas.winfo_width() <= 1:
+            return self.root.winfo_screenwidth(), self.root.winfo_screenheight()
+        return max(100, self.canvas.winfo_width()), max(100, self.canvas.winfo_height())
+
+    def request_render(self, interactive=True):
+        """Schedule a redraw of the view.
+
+        Requests arriving within the same display frame collapse into a single
+        render (counted in render_stats). Interactive renders paint a fast
+        preview and schedule the high-quality pass for when input has been idle
+        for refine_delay_ms; each render makes pending refinement stale.
+        """
+        self.render_stats['requested'] += 1
+        self._frame_interactive = self._frame_interactive and interactive
+        if self._frame_job is not None:
+            self.render_stats['coalesced'] += 1
+            return
+        wait = FRAME_INTERVAL_MS - (time.perf_counter() - self._last_frame) * 1000
+        if wait > 0:
+            self._frame_job = self.root.after(int(wait) + 1, self._flush_render)
         else:
-            # Use zoom factor
-            target_w = max(1, int(display.width * self.zoom))
-            target_h = max(1, int(display.height * self.zoom))
+            # Still runs after the events already queued, so a burst lands in this frame
+            self._frame_job = self.root.after_idle(self._flush_render)
 
-        # Resize with high quality
-        try:
-            resized = display.resize((target_w, target_h), Image.LANCZOS)
-        except Exception:
-            resized = display
+    def _flush_render(self):
+        self._frame_job = None
+        interactive = self._frame_interactive
+        self._frame_interactive = True
+        self._last_frame = time.perf_counter()
+        self.render_stats['rendered'] += 1
+        self._render_gen += 1
+        if self._refine_job is not None:
+            self.root.after_cancel(self._refine_job)
+            self._refine_job = None
+        if self._render(refine_budget=0 if interactive else None):
+            self._refine_job = self.root.after(self.refine_delay_ms, self._refine, self._render_gen)
+
+    def _refine(self, gen):
+        self._refine_job = None
+        if gen != self._render_gen or self.engine.img is None:
+            return
+        if self._render(refine_budget=REFINE_SLICE_S):
+            # Tiles still at preview quality: yield to pending input, then continue
+            self._refine_job = self.root.after(1, self._refine, gen)
+
+    def _render(self, refine_budget=None):
+        """Have the engine paint the viewport; returns how many tiles are still at preview quality"""
+        if self.engine.img is None:
+            return 0
+        viewport = self._viewport()
+        if self.animation is not None:
+            # Frames are rendered for exactly this view by the player's worker; the
+            # static first frame below is only drawn until playback has started
+            self.animation.set_view(self.engine.animation_view(viewport))
+            if self.animation.started:
+                return 0
+        with tracer.run('frame', refine_budget=refine_budget):
+            with tracer.span('clear'):
+                frame = self.surface.begin(viewport)
+            previews = self.engine.render(frame, refine_budget)
+            with tracer.span('present'):
+                self.surface.present()
+        if self.engine.redecoding and self._redecode_job is None:
+            self._redecode_job = self.root.after(DECODE_POLL_MS, self._await_redecode)
+        if self.hud_visible:
+            self.hud.config(text=self.engine.hud_text(self._hud_counters()))
+        return previews
+
+    def _await_redecode(self):
+        """Redraw once the larger decode a zoom started has landed"""
+        self._redecode_job = None
+        if self.engine.finish_redecode():
+            self.request_render()
+        elif self.engine.redecoding:
+            self._redecode_job = self.root.after(DECODE_POLL_MS, self._await_redecode)
 
-        self.tkimg = ImageTk.PhotoImage(resized)
-        self.image_label.config(image=self.tkimg)
+    def _show_frame(self, view, image):
+        """Put a frame rendered by the AnimationPlayer on screen"""
+        size, box = view[:2]
+        frame = self.surface.begin(size)
+        frame.paste(image, box[:2])
+        self.surface.present()
+
+    def pan_by(self, dx, dy):
+        """Pan by a fraction of the viewport"""
+        if self.engine.img is None:
+            return
+        view_w, view_h = self._viewport()
+        self._pan_pixels(dx * view_w, dy * view_h)
+
+    def _pan_pixels(self, dx, dy):
+        self.engine.pan(dx, dy, self._viewport())
+        self.request_render()
+
+    def _on_drag_start(self, event):
+        self._drag_start = (event.x, event.y)
+        self.canvas.config(cursor='fleur')
+
+    def _on_drag(self, event):
+        if self._drag_start is None or self.engine.img is None:
+            return
+        x, y = self._drag_start
+        self._drag_start = (event.x, event.y)
+        self._pan_pixels(x - event.x, y - event.y)
+
+    def _on_drag_end(self, event):
+        self._drag_start = None
+        self.canvas.config(cursor='')
 
     def _update_status(self):
         if not self.images:
@@ -365,26 +1064,49 @@ class ImageViewer:
         path = self.images[self.index]
         fname = os.path.basename(path)
         
-        # Get file size
-        try:
-            size_bytes = os.path.getsize(path)
-            if size_bytes < 1024:
-                size_str = f'{size_bytes} B'
-            elif size_bytes < 1024 * 1024:
-                size_str = f'{size_bytes / 1024:.1f} KB'
-            else:
-                size_str = f'{size_bytes / (1024 * 1024):.1f} MB'
-        except:
-            size_str = 'Unknown'
+        # File size and dimensions come from the metadata index, never from the filesystem
+        engine = self.engine
+        record = engine.metadata.get(path)
+        if record is None:
+            size_str = '…'
+        elif record.size < 1024:
+            size_str = f'{record.size} B'
+        elif record.size < 1024 * 1024:
+            size_str = f'{record.size / 1024:.1f} KB'
+        else:
+            size_str = f'{record.size / (1024 * 1024):.1f} MB'
         
-        mode_str = 'Fit' if self.fit_mode else f'{self.zoom:.0%}'
+        mode_str = 'Fit' if engine.fit_mode else f'{engine.zoom:.0%}'
+        rotation_str = f'{engine.rotation}°' if not engine.fine_angle else f'{engine.rotation}° {engine.fine_angle:+g}°'
         
-        info = (f'{self.index + 1}/{len(self.images)}  •  '
+        # While skimming past uncached images the previous frame is still on screen
+        if engine.img_path == path:
+            dims_str = '{}×{}px'.format(*engine.display_size)
+        elif record is not None:
+            dims_str = '{}×{}px (loading)'.format(*record.display_size)
+        else:
+            dims_str = 'Loading…'
+        
+        self._reported_bytes = engine.memory.nbytes
+        memory_str = f'{engine.memory.nbytes / (1024 * 1024):.0f}/{engine.memory.max_bytes // (1024 * 1024)} MB'
+        
+        count = f'{len(self.images)}+' if self.scanner is not None else len(self.images)
+        info = (f'{self.index + 1}/{count}  •  '
                 f'{fname}  •  '
-                f'{self.img.width}×{self.img.height}px  •  '
+                f'{dims_str}  •  '
                 f'{size_str}  •  '
                 f'Zoom: {mode_str}  •  '
-                f'Rotation: {self.angle}°')
+                f'Rotation: {rotation_str}  •  '
+                f'Memory: {memory_str}')
+        if self.sort_order != 'name':
+            info += f'  •  Sort: {self.sort_order}'
+        if self.aspect_filter != 'all':
+            info += f'  •  Filter: {self.aspect_filter}'
+        if self.slideshow:
+            modes = [name for name, on in (('shuffle', self.slideshow_shuffle), ('loop', self.slideshow_loop)) if on]
+            if self.slideshow_transition != 'none':
+                modes.append(self.slideshow_transition)
+            info += '  •  Slideshow' + (f' ({", ".join(modes)})' if modes else '')
         
         self.status.config(text=info, fg=self.text_primary)
 
@@ -400,30 +1122,162 @@ class ImageViewer:
         self.index = (self.index + 1) % len(self.images)
         self.load_image(self.images[self.index])
 
+    def go_to(self, index):
+        if 0 <= index < len(self.images):
+            self.index = index
+            self.load_image(self.images[self.index])
+
+    def toggle_grid(self):
+        self.grid_visible = not self.grid_visible
+        if self.grid_visible:
+            self.image_container.pack_forget()
+            self.grid.pack(fill=BOTH, expand=YES)
+            self.grid.show_index(self.index)
+        else:
+            self.grid.pack_forget()
+            self.image_container.pack(fill=BOTH, expand=YES)
+            self.request_render(interactive=False)
+
+    def toggle_filmstrip(self):
+        self.filmstrip_visible = not self.filmstrip_visible
+        if self.filmstrip_visible:
+            self.filmstrip.pack(side=BOTTOM, fill=X, pady=(5, 0),
+                                before=self.grid if self.grid_visible else self.image_container)
+            self.filmstrip.show_index(self.index)
+        else:
+            self.filmstrip.pack_forget()
+
+    def _refresh_browsers(self, follow=False):
+        for browser, visible in ((self.filmstrip, self.filmstrip_visible), (self.grid, self.grid_visible)):
+            if visible:
+                browser.show_index(self.index) if follow else browser.refresh()
+
+    def cycle_sort(self):
+        self.sort_order = SORT_ORDERS[(SORT_ORDERS.index(self.sort_order) + 1) % len(SORT_ORDERS)]
+        self._apply_view()
+
+    def cycle_aspect_filter(self):
+        names = list(ASPECT_FILTERS)
+        self.aspect_filter = names[(names.index(self.aspect_filter) + 1) % len(names)]
+        self._apply_view()
+
+    def _sort_key(self, path):
+        """Indexed files by the current sort order, then files not indexed yet; ties by path"""
+        record = self.engine.metadata.get(path)
+        value = None
+        if record is not None:
+            if self.sort_order == 'date taken':
+                # Files without an EXIF date sort by modification time, in the same format
+                value = record.taken or time.strftime('%Y:%m:%d %H:%M:%S', time.localtime(record.mtime))
+            elif self.sort_order == 'file size':
+                value = record.size
+            else:
+                value = record.width * record.height
+        return (value is None, value or 0, path)
+
+    def _accepts(self, path):
+        """Whether path passes the aspect filter; files not indexed yet pass until they are"""
+        test = ASPECT_FILTERS[self.aspect_filter]
+        record = self.engine.metadata.get(path)
+        if test is None or record is None:
+            return True
+        width, height = record.display_size
+        return test(width / max(1, height))
+
+    def _apply_view(self):
+        """Rebuild the navigation list for the sort order and filter, keeping the current image in it"""
+        current = self.images[self.index] if self.images else None
+        if self.sort_order == 'name' and self.aspect_filter == 'all':
+            self.images = self.all_images
+        else:
+            accept = lambda path: path == current or self._accepts(path)
+            if self.sort_order == 'name':
+                self.images = self.all_images.filtered(accept)
+            else:
+                self.images = ImageList([path for path in self.all_images if accept(path)], key=self._sort_key)
+        self.index = self.images.index_of(current) or 0 if current is not None else 0
+        self._sync_slideshow()
+        self._prefetch_neighbours()
+        self._refresh_browsers(follow=True)
+        if self.engine.img is not None:
+            self._update_status()
+
+    def _poll_index(self):
+        """Pick up newly indexed metadata: rebuild a sorted or filtered view, refresh the status bar"""
+        metadata = self.engine.metadata
+        if metadata.version != self._index_version:
+            if self.sort_order != 'name' or self.aspect_filter != 'all':
+                # Re-sorting a large folder per indexed chunk would stall the UI; wait for the index to settle
+                if not metadata.pending:
+                    self._index_version = metadata.version
+                    self._apply_view()
+            else:
+                self._index_version = metadata.version
+                if self.engine.img is not None:
+                    self._update_status()
+        self.root.after(INDEX_POLL_MS, self._poll_index)
+
     def zoom_by(self, factor):
-        if self.img is None:
+        if self.engine.img is None:
             return
-        self.fit_mode = False
-        self.zoom *= factor
-        self.zoom = max(0.05, min(self.zoom, 20))
-        self._render()
+        self.engine.zoom_by(factor)
+        self.request_render()
         self._update_status()
 
     def fit_to_window(self):
-        if self.img is None:
+        if self.engine.img is None:
             return
-        self.fit_mode = True
-        self.zoom = 1.0
-        self._render()
+        self.engine.fit()
+        self.request_render(interactive=False)
         self._update_status()
 
     def rotate(self, degrees):
-        if self.img is None:
+        if self.engine.img is None:
+            return
+        self.engine.rotate(degrees)
+        self.request_render()
+        self._update_status()
+
+    def rotate_fine(self, degrees):
+        """Free rotation in small steps; resampled, unlike the lossless quarter turns"""
+        if self.engine.img is None:
             return
-        self.angle = (self.angle + degrees) % 360
-        self._render()
+        self.engine.rotate_fine(degrees)
+        self.request_render()
         self._update_status()
 
+    def toggle_hud(self):
+        self.hud_visible = not self.hud_visible
+        if self.hud_visible:
+            self.hud.config(text=self.engine.hud_text(self._hud_counters()))
+            self.hud.place(x=8, y=8)
+        else:
+            self.hud.place_forget()
+
+    def _hud_counters(self):
+        """Front-end counters shown under the engine's timings in the HUD"""
+        counters = {f'renders {name}': count for name, count in self.render_stats.items()}
+        counters.update((f'loads {name}', count) for name, count in self.nav_stats.items())
+        counters['frame buffers'] = self.surface.allocations
+        counters['buffer MB'] = f'{self.surface.allocated_bytes / 2**20:.1f}'
+        counters['presents'] = self.surface.presents
+        if self.animation is not None:
+            counters.update((f'frames {name}', count) for name, count in self.animation.stats.items())
+        if self.slideshow_jitter:
+            late = self.slideshow_jitter
+            counters['slide late avg ms'] = f'{sum(late) / len(late):.1f}'
+            counters['slide late max ms'] = f'{max(late):.1f}'
+        return counters
+
+    def export_trace(self):
+        """Save the recorded spans for offline profiling"""
+        path = filedialog.asksaveasfilename(
+            title='Export Trace', defaultextension='.json',
+            filetypes=[('Chrome trace (chrome://tracing, Perfetto)', '*.json'), ('JSON lines', '*.jsonl')])
+        if path:
+            count = tracer.export(path)
+            self.status.config(text=f'Trace: {count} spans written to {path}', fg=self.text_primary)
+
     def toggle_fullscreen(self):
         self.is_fullscreen = not self.is_fullscreen
         self.root.attributes('-fullscreen', self.is_fullscreen)
@@ -434,7 +1288,7 @@ class ImageViewer:
             self.root.attributes('-fullscreen', False)
 
     def toggle_slideshow(self):
-        if not self.images:
+        if not self.images and not self.slideshow:
             return
         
         self.slideshow = not self.slideshow
@@ -442,32 +1296,175 @@ class ImageViewer:
         if self.slideshow:
             self.slideshow_btn_widget.label.config(text='  ⏸ Pause  ')
             self.indicator.config(fg=self.warning)
-            threading.Thread(target=self._slideshow_loop, daemon=True).start()
+            self._shuffle_order = None
+            self._slide_due = time.perf_counter() + self.slideshow_delay
+            self._schedule_slide()
         else:
             self.slideshow_btn_widget.label.config(text='  ▶ Slideshow  ')
             self.indicator.config(fg=self.success)
+            for job in (self._slide_job, self._transition_job):
+                if job is not None:
+                    self.root.after_cancel(job)
+            self._slide_job = self._transition_job = None
+            self._transition_future = None
+            self._next_slide = None
+            if self.engine.img is not None:
+                self.request_render(interactive=False)  # in case a transition was cut short
+        if self.engine.img is not None:
+            self._update_status()
 
-    def _slideshow_loop(self):
-        while self.slideshow:
-            time.sleep(self.slideshow_delay)
-            if not self.slideshow:
-                break
-            self.index = (self.index + 1) % len(self.images)
-            self.root.after(0, lambda: self.load_image(self.images[self.index]))
+    def cycle_transition(self):
+        self.slideshow_transition = TRANSITIONS[(TRANSITIONS.index(self.slideshow_transition) + 1) % len(TRANSITIONS)]
+        if self.engine.img is not None:
+            self._update_status()
+
+    def toggle_shuffle(self):
+        self.slideshow_shuffle = not self.slideshow_shuffle
+        self._shuffle_order = None
+        if self.slideshow:
+            self._schedule_slide()  # same deadline, different next slide
+        if self.engine.img is not None:
+            self._update_status()
+
+    def toggle_loop(self):
+        self.slideshow_loop = not self.slideshow_loop
+        if self.engine.img is not None:
+            self._update_status()
+
+    def _pick_next_slide(self):
+        """Path of the slide after the current one, or None when a non-looping show is over"""
+        current = self.images[self.index]
+        if self.slideshow_shuffle:
+            if not self._shuffle_order:
+                if self._shuffle_order is not None and not self.slideshow_loop:
+                    return None
+                self._shuffle_order = [path for path in self.images if path != current] or [current]
+                random.shuffle(self._shuffle_order)
+            return self._shuffle_order.pop()
+        if self.index + 1 < len(self.images):
+            return self.images[self.index + 1]
+        return self.images[0] if self.slideshow_loop else None
+
+    def _sync_slideshow(self):
+        """Keep the slideshow's plan inside self.images after paths were removed or filtered out"""
+        if self._shuffle_order:
+            self._shuffle_order = [path for path in self._shuffle_order if self.images.index_of(path) is not None]
+        if not self.slideshow:
+            return
+        if not self.images:
+            self.toggle_slideshow()
+        elif self._next_slide is not None and self.images.index_of(self._next_slide) is None:
+            self._schedule_slide()  # same deadline, another slide
+
+    def _schedule_slide(self):
+        """Choose the next slide, start decoding it now and wake up on its deadline"""
+        for job in (self._slide_job, self._transition_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self._slide_job = self._transition_job = None
+        self._transition_future = None
+        self._next_slide = self._pick_next_slide()
+        if self._next_slide is None:
+            self.toggle_slideshow()
+            return
+        self._prefetch_neighbours()
+        self._next_slide_future = self.engine.prefetcher.decode(self._next_slide, self._viewport())
+        delay = max(0.0, self._slide_due - time.perf_counter())
+        self._slide_job = self.root.after(round(delay * 1000), self._advance_slide)
+        if self.slideshow_transition != 'none':
+            # Late enough that the current slide has been rendered and refined
+            lead = max(delay - TRANSITION_LEAD_S, delay / 2)
+            self._transition_job = self.root.after(round(lead * 1000), self._prepare_transition)
+
+    def _prepare_transition(self):
+        """Snapshot the current frame and build the transition frames on a worker"""
+        self._transition_job = None
+        if self.surface.frame is None:
+            return
+        self._transition_gen = self._render_gen
+        self._transition_future = self._transition_pool.submit(
+            self._build_transition, self.surface.frame.copy(), self._next_slide,
+            self._next_slide_future, self.slideshow_transition)
+
+    def _build_transition(self, start, path, decoded, kind):
+        """Worker: the next slide's fit view, then the frames leading to it"""
+        decoded.result()
+        entry = self.engine.cache.get(path)
+        if entry is None:
+            return None
+        end = fit_frame(entry.image, entry.full_size, start.size, self.bg_darker, entry.orientation)
+        return transition_frames(start, end, kind, max(1, TRANSITION_MS * TRANSITION_FPS // 1000 - 1))
+
+    def _advance_slide(self):
+        self._slide_job = None
+        if not self.slideshow:
+            return
+        if not self._next_slide_future.done():
+            # Running late: show the real image as soon as it is decoded, not a preview
+            self._slide_job = self.root.after(DECODE_POLL_MS, self._advance_slide)
+            return
+        now = time.perf_counter()
+        self.slideshow_jitter.append((now - self._slide_due) * 1000)
+        # Deadlines advance by the delay itself, so decode and timer latency never accumulate
+        self._slide_due += self.slideshow_delay
+        if self._slide_due < now:
+            self._slide_due = now + self.slideshow_delay
+
+        # Frames not ready in time, or the view changed since the snapshot: hard cut
+        future = self._transition_future
+        frames = None
+        if (future is not None and future.done() and not future.cancelled() and future.exception() is None
+                and self._transition_gen == self._render_gen and self.animation is None):
+            frames = future.result()
+        if frames and frames[0].size == self.surface.frame.size:
+            self._play_transition(frames, 0, now)
+        else:
+            self._finish_slide()
+
+    def _play_transition(self, frames, i, start):
+        """Show transition frame i on its deadline, then the slide itself"""
+        self._slide_job = None
+        if not self.slideshow:
+            return
+        if i == len(frames):
+            self._finish_slide()
+            return
+        self.surface.frame.paste(frames[i])
+        self.surface.present()
+        due = start + (i + 1) / TRANSITION_FPS
+        self._slide_job = self.root.after(max(0, round((due - time.perf_counter()) * 1000)),
+                                          self._play_transition, frames, i + 1, start)
+
+    def _finish_slide(self):
+        index = self.images.index_of(self._next_slide)
+        if index is None:
+            self._schedule_slide()  # the slide left the list after it was picked
+            return
+        self.index = index
+        self.load_image(self._next_slide)
+        self._schedule_slide()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Professional Image Viewer')
+    parser.add_argument('--max-cache-mb', type=int, default=MAX_CACHE_MB,
+                        help=f'memory for decoded images, pyramid levels and tiles (default {MAX_CACHE_MB})')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write per-stage timings on exit: Chrome trace format for .json, else JSON lines')
+    args = parser.parse_args()
+
     root = Tk()
-    app = ImageViewer(root)
+    app = ImageViewer(root, max_cache_mb=args.max_cache_mb)
+    app.trace_path = args.trace
     
     # Handle window resize
     last_size = [0, 0]
     def on_resize(event):
-        if app.img is not None:
+        if app.engine.img is not None:
             current_size = [app.view_frame.winfo_width(), app.view_frame.winfo_height()]
             if current_size != last_size:
                 last_size[0], last_size[1] = current_size
-                app._render()
+                app.request_render()
     
     root.bind('<Configure>', on_resize)
     root.mainloop()
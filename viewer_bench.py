@@ -0,0 +1,232 @@
+"""
+Viewer benchmark - decode, first-paint, zoom and navigation latencies of the viewer engine
+
+Generates a fixed set of synthetic images (the same pixels on every run) in
+several resolutions and formats, drives a headless ViewerEngine over them and
+reports median latencies in milliseconds. Results can be saved as a baseline;
+later runs are compared against it and regressions are flagged (exit status 1).
+
+Run: python viewer_bench.py [--save-baseline] [--repeat N] [--sizes 12mp,24mp]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import PIL
+from PIL import Image, ImageDraw
+
+from viewer_engine import ViewerEngine, decode_image, tracer
+
+# Synthetic test set; each image is generated once per work directory
+BENCH_SIZES = {'hd': (1920, 1080), '12mp': (4000, 3000), '24mp': (6000, 4000)}
+BENCH_FORMATS = {
+    'jpeg': ('.jpg', {'quality': 90}),
+    'png': ('.png', {'compress_level': 6}),
+    'webp': ('.webp', {'quality': 85}),
+    'bmp': ('.bmp', {}),
+    'tiff': ('.tif', {}),       # uncompressed: large ones take the memory-mapped region path
+}
+BENCH_SEED = 2024
+BENCH_VIEWPORT = (1280, 800)
+ZOOM_STEPS = (1.25,) * 6        # zoom-in presses from fit, each rendered as an interactive preview
+
+# Regression check: slower than baseline by more than this fraction *and* this many ms
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'viewer_bench_baseline.json')
+REGRESSION_THRESHOLD = 0.25
+REGRESSION_MIN_MS = 2.0
+
+
+def synthetic_image(size, seed=BENCH_SEED):
+    """Deterministic RGB test image with smooth areas, hard edges and fine detail"""
+    w, h = size
+    rng = random.Random(seed)
+    fractal = Image.effect_mandelbrot(size, (-2.2, -1.2, 0.8, 1.2), 64)
+    ramp = Image.linear_gradient('L').resize(size, Image.BILINEAR)
+    shapes = Image.radial_gradient('L').resize(size, Image.BILINEAR)
+    draw = ImageDraw.Draw(shapes)
+    for _ in range(200):
+        x, y = rng.randrange(w), rng.randrange(h)
+        r = rng.randrange(8, max(9, w // 12))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=rng.randrange(256))
+    return Image.merge('RGB', (fractal, ramp, shapes))
+
+
+def build_images(workdir, sizes, formats):
+    """Write the test set into workdir (reusing files already there) and return [(name, path)]"""
+    images = []
+    for size_name in sizes:
+        source = None
+        for fmt in formats:
+            ext, options = BENCH_FORMATS[fmt]
+            path = os.path.join(workdir, f'{size_name}-{fmt}{ext}')
+            if not os.path.exists(path):
+                if source is None:
+                    source = synthetic_image(BENCH_SIZES[size_name])
+                source.save(path, **options)
+            images.append((f'{size_name}/{fmt}', path))
+    return images
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def new_engine():
+    return ViewerEngine(background='#171717', thumbnails=False, metadata=False)
+
+
+def bench_image(path, viewport, repeat):
+    """Decode, first-paint and zoom timings (ms, medians over repeat runs) for one file"""
+    decode, first_paint, zoom, zoom_max = [], [], [], []
+    for run in range(repeat + 1):  # the first run only warms the OS file cache
+        t_decode = timed(lambda: decode_image(path, viewport))
+
+        engine = new_engine()
+        def show():
+            engine.set_image(path, engine.decode(path, viewport))
+            engine.render_frame(viewport)
+        t_paint = timed(show)
+
+        steps = []
+        engine.zoom = engine.display_scale(viewport)  # zoom in from the fitted view
+        for factor in ZOOM_STEPS:
+            engine.zoom_by(factor)
+            steps.append(timed(lambda: engine.render_frame(viewport, refine_budget=0)))
+        engine.shutdown()
+        if run:
+            decode.append(t_decode)
+            first_paint.append(t_paint)
+            zoom.append(statistics.median(steps))
+            zoom_max.append(max(steps))
+    return {'decode_ms': statistics.median(decode), 'first_paint_ms': statistics.median(first_paint),
+            'zoom_ms': statistics.median(zoom), 'zoom_max_ms': statistics.median(zoom_max)}
+
+
+def bench_navigation(images, viewport, repeat):
+    """Time to show each image when navigating forward with the next one prefetched, as the viewer does"""
+    times = {name: [] for name, _ in images}
+    for run in range(repeat + 1):
+        engine = new_engine()
+        paths = [path for _, path in images]
+        engine.prefetcher.decode(paths[0], viewport).result()
+        for i, (name, path) in enumerate(images):
+            def show():
+                engine.set_image(path, engine.decode(path, viewport))
+                engine.reset_view()
+                engine.render_frame(viewport)
+            t = timed(show)
+            if run:
+                times[name].append(t)
+            if i + 1 < len(paths):
+                # Dwell on the image until its neighbour is decoded, so only the cache path is timed
+                engine.prefetcher.decode(paths[i + 1], viewport).result()
+        engine.shutdown()
+    return {name: statistics.median(values) for name, values in times.items()}
+
+
+def environment(viewport):
+    return {'python': platform.python_version(), 'pillow': PIL.__version__, 'machine': platform.machine(),
+            'system': platform.system(), 'cpus': os.cpu_count(), 'viewport': list(viewport)}
+
+
+def compare(results, baseline, threshold, min_ms):
+    """(name, metric, baseline ms, current ms) for every metric that got slower than allowed"""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if old is not None and value > old * (1 + threshold) and value - old > min_ms:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    metrics = ['decode_ms', 'first_paint_ms', 'zoom_ms', 'zoom_max_ms', 'navigate_ms']
+    print(f'{"image":<12}' + ''.join(f'{m[:-3]:>16}' for m in metrics))
+    for name, values in results.items():
+        cells = []
+        for metric in metrics:
+            cell = f'{values[metric]:.1f}'
+            old = (baseline or {}).get(name, {}).get(metric)
+            if old:
+                cell += f' ({(values[metric] - old) / old:+.0%})'
+            cells.append(f'{cell:>16}')
+        print(f'{name:<12}' + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the image viewer engine on synthetic images')
+    parser.add_argument('--sizes', default=','.join(BENCH_SIZES), help='comma-separated: ' + ', '.join(BENCH_SIZES))
+    parser.add_argument('--formats', default=','.join(BENCH_FORMATS), help='comma-separated: ' + ', '.join(BENCH_FORMATS))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement (median is reported)')
+    parser.add_argument('--viewport', default='%dx%d' % BENCH_VIEWPORT, help='WIDTHxHEIGHT')
+    parser.add_argument('--workdir', help='keep the generated images here between runs')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--trace', help='write per-stage spans: Chrome trace format for .json, else JSON lines')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline to compare against, if it exists')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f'allowed slowdown as a fraction (default {REGRESSION_THRESHOLD})')
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    formats = [f for f in args.formats.split(',') if f]
+    unknown = [s for s in sizes if s not in BENCH_SIZES] + [f for f in formats if f not in BENCH_FORMATS]
+    if unknown:
+        parser.error('unknown size or format: ' + ', '.join(unknown))
+    viewport = tuple(int(v) for v in args.viewport.lower().split('x'))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='viewer-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        images = build_images(workdir, sizes, formats)
+        results = {}
+        for name, path in images:
+            results[name] = bench_image(path, viewport, args.repeat)
+            print(f'  {name} done', file=sys.stderr)
+        for name, value in bench_navigation(images, viewport, args.repeat).items():
+            results[name]['navigate_ms'] = value
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'environment': environment(viewport), 'results': results}
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != report['environment']:
+            print('note: baseline was recorded in a different environment:', baseline.get('environment'))
+    print_table(results, baseline and baseline['results'])
+
+    if args.trace:
+        tracer.export(args.trace)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline['results'], args.threshold, REGRESSION_MIN_MS)
+    for name, metric, old, new in regressions:
+        print(f'REGRESSION {name} {metric}: {old:.1f} -> {new:.1f} ms ({(new - old) / old:+.0%})')
+    if not regressions:
+        print(f'no regressions against {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2051 @@
+"""
+Viewer engine - decoding, caching, rotation and scaling for the image viewers, without Tk
+
+The viewer front-ends only handle widgets and input; everything that turns
+an image file into viewport pixels lives here, so it can be driven (and
+benchmarked, see viewer_bench.py) without a display.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import mmap
+import os
+import queue
+import re
+import select
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote
+from PIL import Image, PngImagePlugin, TiffImagePlugin, TiffTags
+
+SUPPORTED_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tiff', '.tif', '.ico', '.ppm', '.pgm')
+
+# Images decoding to more than REGION_MIN_MB are read region by region: uncompressed
+# files are memory-mapped, tiled/striped TIFFs decode only the tiles in view
+MAPPED_EXTS = ('.bmp', '.tiff', '.tif', '.ppm', '.pgm')
+TIFF_EXTS = ('.tiff', '.tif')
+REGION_MIN_MB = 16
+RAW_PIXEL_BYTES = {'L': 1, 'RGB': 3, 'BGR': 3, 'RGBX': 4, 'BGRX': 4, 'RGBA': 4, 'BGRA': 4}
+SOURCE_OVERVIEW = 2048      # overview decoded for region sources when no viewport is given
+SOURCE_PAD = 4              # extra source pixels read around a tile for the resampling filter
+
+# Neighbour prefetch settings
+PREFETCH_AHEAD = 3          # images decoded ahead of the current one
+PREFETCH_BEHIND = 1         # images decoded behind the current one
+PREFETCH_WORKERS = 2
+
+# Freedesktop.org thumbnail cache, shared with file managers
+THUMBNAIL_SIZES = {'x-large': 512, 'large': 256, 'normal': 128}  # largest first
+THUMBNAIL_CACHE_MB = 256    # size of the thumbnails this viewer wrote; other applications' are left alone
+THUMBNAIL_SOFTWARE = 'Image Viewer Pro'  # Software tag identifying our own thumbnails
+THUMBNAIL_WORKERS = 1
+THUMBNAIL_EVICT_EVERY = 64  # thumbnail writes between size checks
+
+# Viewport tiling: only the tiles inside the viewport are resampled
+TILE_SIZE = 256             # display tiles are resampled and cached at this size
+PYRAMID_MIN_SIZE = 64       # stop halving once a level's longer side gets this small
+
+# Preview tiles use a cheap filter; finished tiles are resampled with LANCZOS
+FAST_RESAMPLE = Image.BILINEAR
+
+# Multi-core resampling: Pillow releases the GIL while it resamples, so strips of a large
+# image (and the tiles of a full-quality render) are resampled on a thread pool
+RESAMPLE_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_PIXELS = 4 * 1024 * 1024  # source pixels below which one thread is faster
+STRIP_MIN_ROWS = 32         # output rows per strip, at least
+FILTER_SUPPORT = {Image.NEAREST: 0.5, Image.BOX: 0.5, Image.BILINEAR: 1.0, Image.HAMMING: 1.0,
+                  Image.BICUBIC: 2.0, Image.LANCZOS: 3.0}  # as Pillow's resampling filters
+
+# Memory: decoded images, pyramid levels and tiles share one budget (max_cache_mb)
+MAX_CACHE_MB = 768
+LOW_MEMORY_MB = 512         # start evicting when the OS has less than this available
+
+# Folder scanning: batches grow from SCAN_FIRST_BATCH so the first image shows up quickly
+SCAN_FIRST_BATCH = 64
+SCAN_MAX_BATCH = 8192
+
+# Folder watching: inotify where available, otherwise listings compared every WATCH_POLL_S
+WATCH_POLL_S = 1.0          # also how often the inotify thread checks for cancellation
+WATCH_BUFFER = 64 * 1024    # bytes of inotify events read at a time
+
+# Metadata index: header fields of scanned images, kept in SQLite across sessions
+INDEX_WORKERS = 2
+INDEX_CHUNK = 256           # paths revalidated (and rows written) per worker task
+
+# Rotation: quarter turns are exact transposes; anything else goes through the lossy path
+QUARTER_TURNS = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+MIRRORED_TURNS = {0: Image.FLIP_LEFT_RIGHT, 90: Image.TRANSPOSE, 180: Image.FLIP_TOP_BOTTOM, 270: Image.TRANSVERSE}
+# EXIF Orientation -> (mirrored, quarter turns) that show the stored pixels upright; the mirror comes first
+ORIENTATIONS = {1: (False, 0), 2: (True, 0), 3: (False, 180), 4: (True, 180),
+                5: (True, 90), 6: (False, 270), 7: (True, 270), 8: (False, 90)}
+FREE_RESAMPLE = Image.BICUBIC  # best filter Image.transform offers for free rotation
+
+# Instrumentation: every decode and render stage is timed into a bounded trace buffer
+TRACE_CAPACITY = 50000      # spans kept for export; older ones are dropped
+
+# Animated GIF/WebP playback: frames are rendered ahead into a bounded buffer
+ANIMATION_BUFFER = 12       # frames rendered ahead of the one on screen
+ANIMATION_DEFAULT_MS = 100  # used for missing or near-zero frame durations, as browsers do
+ANIMATION_POLL_MS = 5       # retry interval when the renderer has fallen behind
+
+
+def image_nbytes(img):
+    """Approximate memory held by a decoded image (Pillow stores multi-band pixels in 4 bytes)"""
+    return img.width * img.height * (4 if len(img.getbands()) > 1 else 1)
+
+
+def cover_scale(size, viewport):
+    """Smallest scale at which an image fills the viewport in either 90° orientation"""
+    w, h = size
+    vw, vh = viewport
+    return min(1.0, max(min(vw / w, vh / h), min(vw / h, vh / w)))
+
+
+# Threads are only started on first use; on a single core everything stays serial
+resample_pool = ThreadPoolExecutor(max_workers=RESAMPLE_WORKERS, thread_name_prefix='resample') if RESAMPLE_WORKERS > 1 else None
+
+
+def _strips(height, source_pixels):
+    """Row bounds splitting `height` output rows into one strip per worker, or None to stay serial"""
+    count = min(RESAMPLE_WORKERS, height // STRIP_MIN_ROWS)
+    if resample_pool is None or count < 2 or source_pixels < PARALLEL_MIN_PIXELS:
+        return None
+    return [height * i // count for i in range(count + 1)]
+
+
+def _stitch(mode, size, bounds, parts):
+    out = Image.new(mode, size)
+    for top, part in zip(bounds, parts):
+        out.paste(part, (0, top))
+    return out
+
+
+def parallel_resize(image, size, resample=Image.LANCZOS, box=None, reducing_gap=None):
+    """image.resize() computed as horizontal strips on the resample pool, equal to within rounding.
+
+    Each strip hands Pillow the full image and, as its box, exactly the source
+    rows it maps from. Pillow reads the filter's support past the box edges,
+    so neighbouring strips overlap in the source by the filter's reach and
+    are stitched without seams.
+    """
+    box = tuple(box) if box else (0, 0) + image.size
+    if image.size == size and box == (0, 0) + image.size:
+        return image.copy()
+    bounds = _strips(size[1], (box[2] - box[0]) * (box[3] - box[1]))
+    if (bounds is None or image.mode not in ('L', 'RGB', 'RGBA') or resample == Image.NEAREST
+            or image.height > image.width * 100):
+        return image.resize(size, resample, box=box, reducing_gap=reducing_gap)
+    if image.mode == 'RGBA':
+        # Pillow resamples RGBA premultiplied (and then skips reducing_gap); convert once, not per strip
+        source = image.convert('RGBa')
+    else:
+        source = image
+        factor_x = factor_y = 1
+        if reducing_gap:
+            factor_x = int((box[2] - box[0]) / size[0] / reducing_gap) or 1
+            factor_y = int((box[3] - box[1]) / size[1] / reducing_gap) or 1
+        if factor_x > 1 or factor_y > 1:
+            # As Image.resize does: a cheap integer reduce of the box plus the filter's support first
+            support_x = (FILTER_SUPPORT[resample] - 0.5) * (box[2] - box[0]) / size[0]
+            support_y = (FILTER_SUPPORT[resample] - 0.5) * (box[3] - box[1]) / size[1]
+            reduce_box = (max(0, int(box[0] - support_x)), max(0, int(box[1] - support_y)),
+                          min(image.width, math.ceil(box[2] + support_x)),
+                          min(image.height, math.ceil(box[3] + support_y)))
+            source = parallel_reduce(image, (factor_x, factor_y), reduce_box)
+            box = ((box[0] - reduce_box[0]) / factor_x, (box[1] - reduce_box[1]) / factor_y,
+                   (box[2] - reduce_box[0]) / factor_x, (box[3] - reduce_box[1]) / factor_y)
+    scale = (box[3] - box[1]) / size[1]
+
+    def strip(top, bottom):
+        return source.resize((size[0], bottom - top), resample,
+                             box=(box[0], box[1] + top * scale, box[2], box[1] + bottom * scale))
+
+    out = _stitch(source.mode, size, bounds, resample_pool.map(strip, bounds[:-1], bounds[1:]))
+    return out.convert('RGBA') if image.mode == 'RGBA' else out
+
+
+def parallel_reduce(image, factor, box=None):
+    """image.reduce(factor, box) computed as horizontal strips on the resample pool; identical pixels"""
+    factor_x, factor_y = factor if isinstance(factor, tuple) else (factor, factor)
+    box = box or (0, 0) + image.size
+    size = (-(-(box[2] - box[0]) // factor_x), -(-(box[3] - box[1]) // factor_y))
+    bounds = _strips(size[1], (box[2] - box[0]) * (box[3] - box[1]))
+    if bounds is None or image.mode not in ('L', 'RGB', 'RGBA'):
+        return image.reduce(factor, box=box)
+
+    def strip(top, bottom):
+        # Whole factor-sized blocks per strip, so no block is split between two strips
+        return image.reduce((factor_x, factor_y),
+                            box=(box[0], box[1] + top * factor_y, box[2], min(box[3], box[1] + bottom * factor_y)))
+
+    return _stitch(image.mode, size, bounds, resample_pool.map(strip, bounds[:-1], bounds[1:]))
+
+
+class Tracer:
+    """Times the stages of decoding and rendering.
+
+    Spans go into a bounded buffer that can be exported as JSON lines or in
+    Chrome's trace-event format (chrome://tracing, Perfetto). Stages inside
+    a run(), such as one frame or one decode, are also summed per stage, and
+    `last` keeps those sums for the most recent run of each kind.
+    """
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.enabled = True
+        self.events = deque(maxlen=capacity)  # (name, start, duration, thread id, args), in seconds
+        self.last = {}                        # run name -> {stage: ms, 'total': ms}
+        self.epoch = time.perf_counter()
+        self._threads = {}
+        self._local = threading.local()
+
+    def run(self, name, **args):
+        """A frame, decode or load; stages timed inside it on this thread are summed into last[name]"""
+        return _Span(self, name, args, True)
+
+    def span(self, stage, **args):
+        return _Span(self, stage, args, False)
+
+    def _record(self, name, start, end, args):
+        thread = threading.get_ident()
+        if thread not in self._threads:
+            self._threads[thread] = threading.current_thread().name
+        self.events.append((name, start - self.epoch, end - start, thread, args))
+
+    def export(self, path):
+        """Write the buffered spans; Chrome trace format for .json, JSON lines otherwise"""
+        events = list(self.events)
+        with open(path, 'w') as f:
+            if path.lower().endswith('.json'):
+                pid = os.getpid()
+                trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+                         for thread, name in list(self._threads.items())]
+                trace += [{'name': name, 'cat': 'viewer', 'ph': 'X', 'pid': pid, 'tid': thread,
+                           'ts': round(start * 1e6, 1), 'dur': round(duration * 1e6, 1), 'args': args}
+                          for name, start, duration, thread, args in events]
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+            else:
+                for name, start, duration, thread, args in events:
+                    f.write(json.dumps({'name': name, 'start_ms': round(start * 1000, 3),
+                                        'duration_ms': round(duration * 1000, 3),
+                                        'thread': self._threads.get(thread, thread), 'args': args}) + '\n')
+        return len(events)
+
+
+class _Span:
+    """Context manager timing one run or stage; a plain class because this is on the hot path"""
+    __slots__ = ('tracer', 'name', 'args', 'is_run', 'start', 'outer')
+
+    def __init__(self, tracer, name, args, is_run):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.is_run = is_run
+
+    def __enter__(self):
+        if self.is_run:
+            local = self.tracer._local
+            self.outer = getattr(local, 'stages', None)
+            local.stages = {}
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        tracer = self.tracer
+        if not tracer.enabled:
+            if self.is_run:
+                tracer._local.stages = self.outer
+            return
+        ms = (end - self.start) * 1000
+        stages = getattr(tracer._local, 'stages', None)
+        if self.is_run:
+            stages['total'] = ms
+            tracer.last[self.name] = stages
+            tracer._local.stages = self.outer
+        elif stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + ms
+        tracer._record(self.name, self.start, end, self.args)
+
+
+tracer = Tracer()  # shared by the engine, its workers and the front-ends
+
+
+def transpose_method(mirrored, turns):
+    """The single Image.transpose method for a mirror followed by quarter turns, or None for neither"""
+    return MIRRORED_TURNS[turns] if mirrored else QUARTER_TURNS.get(turns)
+
+
+def orient(image, orientation):
+    """image as it should be shown for an EXIF orientation; meant for small images like thumbnails"""
+    method = transpose_method(*ORIENTATIONS.get(orientation, (False, 0)))
+    return image if method is None else image.transpose(method)
+
+
+class DecodedImage:
+    """A decoded image, possibly at reduced resolution, plus its original size and decode time.
+
+    Pixels are kept as stored in the file; `orientation` (EXIF, 1-8) says how
+    they are shown, and full_size is the stored size.
+    """
+    def __init__(self, image, full_size, cost=0.0, source=None, animated=False, orientation=1):
+        self.image = image
+        self.full_size = full_size
+        self.cost = cost
+        self.source = source  # region source for full-resolution reads, when there is one
+        self.animated = animated  # image holds the first frame of an animation
+        self.orientation = orientation
+
+    @property
+    def scale(self):
+        return self.image.width / self.full_size[0]
+
+    @property
+    def is_full(self):
+        return self.image.size == self.full_size
+
+    @property
+    def nbytes(self):
+        return image_nbytes(self.image)
+
+
+def natural_key(name):
+    """Sort key that orders embedded numbers numerically (img2 before img10)"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+class ImageList:
+    """Image paths in natural sort order (or by `key`) with O(1) path -> index lookups"""
+    def __init__(self, paths=(), key=None):
+        self.key = key or (lambda path: natural_key(os.path.basename(path)))
+        self.paths = []
+        self._keys = []
+        self._index = {}
+        self.merge(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        return self.paths[i]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def index_of(self, path):
+        return self._index.get(path)
+
+    def filtered(self, accept):
+        """New list of the paths passing accept, in the same order and without re-sorting"""
+        subset = ImageList(key=self.key)
+        subset._keys, subset.paths = [], []
+        for key, path in zip(self._keys, self.paths):
+            if accept(path):
+                subset._keys.append(key)
+                subset.paths.append(path)
+        subset._index = {path: i for i, path in enumerate(subset.paths)}
+        return subset
+
+    def remove(self, paths):
+        """Drop paths from the list in one linear pass; returns how many were in it"""
+        gone = {path for path in paths if path in self._index}
+        if gone:
+            kept = [(key, path) for key, path in zip(self._keys, self.paths) if path not in gone]
+            self._keys = [key for key, _ in kept]
+            self.paths = [path for _, path in kept]
+            self._index = {path: i for i, path in enumerate(self.paths)}
+        return len(gone)
+
+    def merge(self, paths):
+        """Merge a batch of new paths in a single linear pass instead of re-sorting everything"""
+        new = sorted((self.key(p), p) for p in set(paths) if p not in self._index)
+        if not new:
+            return
+        if self._keys and new[0] < (self._keys[-1], self.paths[-1]):
+            merged = list(heapq.merge(zip(self._keys, self.paths), new))
+            self._keys = [key for key, _ in merged]
+            self.paths = [path for _, path in merged]
+            self._index = {path: i for i, path in enumerate(self.paths)}
+        else:
+            # Common case for sorted listings: the batch goes on the end
+            for key, path in new:
+                self._index[path] = len(self.paths)
+                self._keys.append(key)
+                self.paths.append(path)
+
+
+class FolderScanner:
+    """Streams supported image paths from a folder in growing batches on a background thread"""
+    def __init__(self, folder):
+        self.folder = folder
+        self.batches = queue.Queue()  # lists of paths, then None once the scan is over
+        self._cancelled = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        batch = []
+        limit = SCAN_FIRST_BATCH
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if self._cancelled:
+                        return
+                    if entry.name.lower().endswith(SUPPORTED_EXTS) and entry.is_file():
+                        batch.append(entry.path)
+                        if len(batch) >= limit:
+                            self.batches.put(batch)
+                            batch = []
+                            limit = min(limit * 2, SCAN_MAX_BATCH)
+        except OSError:
+            pass  # an unreadable folder just ends the scan with what we have
+        finally:
+            if batch:
+                self.batches.put(batch)
+            self.batches.put(None)
+
+    def cancel(self):
+        self._cancelled = True
+
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+def _libc_inotify():
+    """libc with inotify_init1/inotify_add_watch, or None where there is no inotify"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FolderWatcher:
+    """Reports supported image files added to, removed from or renamed within a folder.
+
+    Changes are put on `changes` as ('added', path, None), ('removed', path, None)
+    or ('renamed', old, new) from a background thread; 'added' also covers a
+    file rewritten in place. With inotify, files are reported once they are
+    closed after writing, so half-written frames never show up. Elsewhere the
+    folder listing is compared every WATCH_POLL_S and a new or changed file is
+    reported once its size and mtime held still for one interval.
+    ('overflow', folder, None) means inotify dropped events.
+    """
+    def __init__(self, folder, poll=False):
+        self.folder = folder
+        self.changes = queue.Queue()
+        self.method = None          # 'inotify' or 'poll' once the thread is running
+        self._cancelled = False
+        threading.Thread(target=self._run, args=(poll,), daemon=True).start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _wanted(self, name):
+        return name.lower().endswith(SUPPORTED_EXTS)
+
+    def _run(self, poll):
+        libc = None if poll else _libc_inotify()
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC) if libc is not None else -1
+        if fd < 0:
+            self._poll()
+            return
+        try:
+            mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+                    | IN_DELETE_SELF | IN_MOVE_SELF)
+            if libc.inotify_add_watch(fd, os.fsencode(self.folder), mask) < 0:
+                os.close(fd)
+                fd = -1
+                self._poll()
+                return
+            self.method = 'inotify'
+            while not self._cancelled:
+                if not select.select([fd], [], [], WATCH_POLL_S)[0]:
+                    continue
+                try:
+                    data = os.read(fd, WATCH_BUFFER)
+                except BlockingIOError:
+                    continue
+                if not self._dispatch(data):
+                    return  # the folder itself is gone
+        finally:
+            if fd >= 0:
+                os.close(fd)
+
+    def _dispatch(self, data):
+        """Turn one read of inotify events into changes; False once the watch has ended"""
+        moved_from = {}             # cookie -> path; pairs with the MOVED_TO of the same rename
+        offset = 0
+        while offset < len(data):
+            _, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0'))
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.changes.put(('overflow', self.folder, None))
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                return False
+            if mask & IN_ISDIR:
+                continue
+            path = os.path.join(self.folder, name)
+            if mask & IN_MOVED_FROM:
+                if self._wanted(name):
+                    moved_from[cookie] = path
+            elif mask & IN_MOVED_TO:
+                old = moved_from.pop(cookie, None)
+                if old is not None and self._wanted(name):
+                    self.changes.put(('renamed', old, path))
+                elif old is not None:
+                    self.changes.put(('removed', old, None))
+                elif self._wanted(name):
+                    self.changes.put(('added', path, None))  # e.g. a capture renaming its temp file
+            elif self._wanted(name):
+                self.changes.put(('removed' if mask & IN_DELETE else 'added', path, None))
+        # Renamed out of the folder: the matching MOVED_TO never comes
+        for path in moved_from.values():
+            self.changes.put(('removed', path, None))
+        return True
+
+    def _listing(self):
+        """name -> (size, mtime_ns) of the supported files in the folder, or None if it is unreadable"""
+        listing = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if self._wanted(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        listing[entry.name] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+        return listing
+
+    def _poll(self):
+        self.method = 'poll'
+        known = self._listing() or {}
+        unsettled = {}              # name -> stat seen last time, for files not reported yet
+        while not self._cancelled:
+            time.sleep(WATCH_POLL_S)
+            listing = self._listing()
+            if listing is None:
+                continue
+            for name in known.keys() - listing.keys():
+                del known[name]
+                self.changes.put(('removed', os.path.join(self.folder, name), None))
+            for name in unsettled.keys() - listing.keys():
+                del unsettled[name]
+            for name, stat in listing.items():
+                if known.get(name) == stat:
+                    continue
+                if unsettled.get(name) == stat:
+                    del unsettled[name]
+                    known[name] = stat
+                    self.changes.put(('added', os.path.join(self.folder, name), None))
+                else:
+                    unsettled[name] = stat  # still being written, or just appeared
+
+
+class ImageRecord(namedtuple('ImageRecord', 'path size mtime width height format taken orientation')):
+    """What the metadata index knows about one file; `taken` is the EXIF 'YYYY:MM:DD HH:MM:SS' string"""
+    __slots__ = ()
+
+    @property
+    def display_size(self):
+        """Size as shown, i.e. with width and height swapped for sideways EXIF orientations"""
+        return (self.height, self.width) if ORIENTATIONS.get(self.orientation, (False, 0))[1] % 180 else (self.width, self.height)
+
+
+def header_exif(img):
+    """EXIF of an opened image if it can be read without decoding pixels, else None"""
+    # Other formats may keep EXIF after the pixels, where reading it means decoding
+    if img.format in ('JPEG', 'MPO', 'TIFF', 'WEBP') or 'exif' in img.info:
+        try:
+            return img.getexif()
+        except Exception:
+            return None  # a broken EXIF block only costs us the date and orientation
+    return None
+
+
+def exif_orientation(img, stored=False):
+    """EXIF orientation (1-8) of an opened image, 1 if it has none.
+
+    Pillow orients TIFF pixels itself as it decodes them, so TIFFs report 1
+    unless `stored` asks how the pixels lie in the file.
+    """
+    if img.format == 'TIFF' and not stored:
+        return 1
+    exif = header_exif(img)
+    try:
+        orientation = int(exif.get(274, 1)) if exif is not None else 1
+    except (TypeError, ValueError):
+        return 1
+    return orientation if orientation in ORIENTATIONS else 1
+
+
+def read_header(path, st=None):
+    """ImageRecord for path read from its header alone; no pixel data is decoded"""
+    st = st or os.stat(path)
+    with Image.open(path) as img:
+        taken = None
+        orientation = exif_orientation(img)
+        exif = header_exif(img)
+        if exif is not None:
+            try:
+                taken = exif.get_ifd(0x8769).get(36867) or exif.get(306)
+                taken = (str(taken).strip('\x00 ') or None) if taken else None
+            except Exception:
+                pass
+        return ImageRecord(path, st.st_size, st.st_mtime, img.width, img.height, img.format, taken, orientation)
+
+
+class MetadataIndex:
+    """Header metadata of scanned images in SQLite, revalidated by mtime on every scan.
+
+    A worker pool stats each path and reads only the header of files that are
+    new or changed since they were indexed. Records of the open folder are
+    mirrored in `records`, so sorting, filtering and status lookups never touch
+    the filesystem; `version` goes up whenever records change.
+    """
+    def __init__(self, db_path=None, workers=INDEX_WORKERS):
+        if db_path is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+            db_path = os.path.join(cache_home, 'image-viewer', 'metadata.sqlite')
+        try:
+            if db_path != ':memory:':
+                os.makedirs(os.path.dirname(db_path), mode=0o700, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._create()
+        except (OSError, sqlite3.Error):
+            self._db = sqlite3.connect(':memory:', check_same_thread=False)  # still works, just not persisted
+            self._create()
+        self.records = {}           # path -> ImageRecord for the open folder
+        self.version = 0
+        self.folder = None
+        self._gen = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='index')
+
+    def _create(self):
+        self._db.execute('CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, folder TEXT, size INTEGER, '
+                         'mtime REAL, width INTEGER, height INTEGER, format TEXT, taken TEXT, orientation INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS images_folder ON images (folder)')
+        self._db.commit()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def get(self, path):
+        return self.records.get(path)
+
+    def open_folder(self, folder):
+        """Load what is already known about folder; work queued for the previous one is dropped"""
+        self._gen += 1
+        for future in list(self._pending):
+            future.cancel()
+        with self._lock:
+            rows = self._db.execute('SELECT path, size, mtime, width, height, format, taken, orientation '
+                                    'FROM images WHERE folder = ?', (folder,)).fetchall()
+        self.folder = folder
+        self.records = {row[0]: ImageRecord(*row) for row in rows}
+        self.version += 1
+
+    def update(self, paths):
+        """Queue paths from a scan for revalidation; unchanged files cost one stat"""
+        paths = list(paths)
+        for i in range(0, len(paths), INDEX_CHUNK):
+            future = self._pool.submit(self._revalidate, paths[i:i + INDEX_CHUNK], self._gen)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+
+    def remove(self, paths):
+        """Forget paths that no longer exist"""
+        gone = [path for path in paths if self.records.pop(path, None) is not None]
+        if gone:
+            self.version += 1
+            self._pool.submit(self._delete, gone)
+
+    def prune(self, paths):
+        """Forget every record of the open folder that a finished scan did not find"""
+        seen = set(paths)
+        self.remove([path for path in list(self.records) if path not in seen])
+
+    def _revalidate(self, paths, gen):
+        rows = []
+        for path in paths:
+            if gen != self._gen:
+                return
+            try:
+                st = os.stat(path)
+                record = self.records.get(path)
+                if record is None or record.mtime != st.st_mtime or record.size != st.st_size:
+                    rows.append(read_header(path, st))
+            except Exception:
+                continue  # vanished or unreadable: the viewer reports it if the image is opened
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 [(r.path, os.path.dirname(r.path)) + tuple(r[1:]) for r in rows])
+            self._db.commit()
+        if gen == self._gen:
+            for record in rows:
+                self.records[record.path] = record
+            self.version += 1
+
+    def _delete(self, paths):
+        with self._lock:
+            self._db.executemany('DELETE FROM images WHERE path = ?', [(path,) for path in paths])
+            self._db.commit()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ImagePyramid:
+    """Power-of-two downscaled copies of an image, each built on first use from the level above.
+
+    Levels below the base are kept in `store` (an ImageCache) under (key, k),
+    so they count against the memory budget and are rebuilt if evicted.
+    """
+    def __init__(self, base, store, key):
+        self.base = base
+        self.store = store
+        self.key = key
+        self.count = 1
+        while max(base.size) >> self.count >= PYRAMID_MIN_SIZE:
+            self.count += 1
+
+    def level(self, k):
+        if k == 0:
+            return self.base
+        img = self.store.get((self.key, k))
+        if img is None:
+            parent = self.level(k - 1)
+            start = time.perf_counter()
+            with tracer.span('pyramid'):
+                img = parallel_reduce(parent, 2)
+            self.store.put((self.key, k), img, cost=time.perf_counter() - start)
+        return img
+
+    def level_for(self, factor):
+        """Index of the smallest level still at or above `factor` times the base size"""
+        k = 0
+        while k + 1 < self.count and factor <= 0.5 ** (k + 1):
+            k += 1
+        return k
+
+
+class MappedImage:
+    """Uncompressed image file memory-mapped and read region by region.
+
+    Only the rows a region touches are paged in by the OS, and for reduced
+    reads only every other row of each output row's span.
+    """
+    def __init__(self, path, fileobj, size, mode, offset, rawmode, stride, orientation):
+        self.path = path
+        self.size = size
+        self.file_mode = mode
+        self.mode = 'RGBA' if mode == 'RGBA' else 'RGB'
+        self.offset = offset
+        self.rawmode = rawmode
+        self.bpp = RAW_PIXEL_BYTES[rawmode]
+        self.stride = stride or size[0] * self.bpp
+        self.orientation = orientation
+        self.map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, path):
+        """MappedImage for path if it is a single raw strip worth mapping, else None"""
+        try:
+            with Image.open(path) as src:
+                if len(src.tile) != 1 or src.mode not in ('L', 'RGB', 'RGBA'):
+                    return None
+                codec, extents, offset, args = src.tile[0]
+                if codec != 'raw' or tuple(extents) != (0, 0) + src.size:
+                    return None
+                rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+                if rawmode not in RAW_PIXEL_BYTES:
+                    return None
+                size, mode = src.size, src.mode
+            if size[0] * size[1] * RAW_PIXEL_BYTES[rawmode] < REGION_MIN_MB * 1024 * 1024:
+                return None  # small enough to just decode
+            with open(path, 'rb') as f:
+                return cls(path, f, size, mode, offset, rawmode, stride, orientation)
+        except (OSError, ValueError, SyntaxError):
+            return None
+
+    def region(self, box, factor=1):
+        """Pixels of box, given in coordinates reduced by `factor`, as an RGB/RGBA image"""
+        w, h = self.size
+        left, top, right, bottom = box
+        x0, x1 = left * factor, min(w, right * factor)
+        y0, y1 = top * factor, min(h, bottom * factor)
+        if x1 <= x0 or y1 <= y0:
+            return Image.new(self.mode, (1, 1))
+        step = max(1, factor // 2)
+        rows = range(y0, y1, step)
+        if x0 == 0 and x1 == w and step == 1 and self.orientation > 0:
+            # Whole consecutive rows: wrap the mapping itself, no intermediate copy
+            data = memoryview(self.map)[self.offset + y0 * self.stride:self.offset + y1 * self.stride]
+            img = Image.frombuffer(self.file_mode, (w, y1 - y0), data, 'raw', self.rawmode, self.stride, 1)
+        else:
+            start, end = self.offset + x0 * self.bpp, self.offset + x1 * self.bpp
+            first = 0 if self.orientation > 0 else (h - 1) * self.stride
+            sign = 1 if self.orientation > 0 else -1
+            data = b''.join(self.map[start + first + sign * y * self.stride:end + first + sign * y * self.stride]
+                            for y in rows)
+            img = Image.frombuffer(self.file_mode, (x1 - x0, len(rows)), data, 'raw', self.rawmode, 0, 1)
+        if factor > 1:
+            img = img.resize((-(-(x1 - x0) // factor), -(-(y1 - y0) // factor)), Image.BOX)
+        return img if img.mode == self.mode else img.convert(self.mode)
+
+
+# Tags a single tile needs to be decoded on its own
+TIFF_TILE_TAGS = (258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 529, 530, 531, 532)
+
+
+class TiffLevel:
+    """One resolution stored in a TIFF: its size and tile (or strip) grid"""
+    def __init__(self, ifd):
+        self.ifd = ifd
+        self.size = self.width, self.height = ifd[256], ifd[257]
+        self.tiled = 324 in ifd
+        if self.tiled:
+            self.tile_size = (ifd[322], ifd[323])
+            self.offsets, self.counts = ifd[324], ifd[325]
+        else:
+            self.tile_size = (self.width, min(self.height, ifd.get(278, self.height)))
+            self.offsets, self.counts = ifd[273], ifd[279]
+        self.columns = -(-self.width // self.tile_size[0])
+        self.rows = -(-self.height // self.tile_size[1])
+        self.planes = ifd.get(277, 1) if ifd.get(284, 1) == 2 else 1
+
+
+class TiffRegions:
+    """TIFF read tile by tile (or strip by strip), using reduced-resolution pages as overviews.
+
+    Each tile is decoded on its own by wrapping its compressed bytes in a
+    one-strip TIFF that Pillow opens, so every codec Pillow supports works.
+    Decoded tiles go through `cache` (an ImageCache) once the viewer attaches one.
+    """
+    def __init__(self, path, fileobj, levels, mode):
+        self.path = path
+        self.fp = fileobj
+        self.levels = levels
+        self.size = levels[0].size
+        self.mode = mode
+        self.cache = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """TiffRegions for a large TIFF split into tiles or strips, else None"""
+        try:
+            with Image.open(path) as src:
+                mode = 'RGBA' if src.mode in ('RGBA', 'LA', 'P') else 'RGB'
+            f = open(path, 'rb')
+        except (OSError, ValueError, SyntaxError):
+            return None
+        try:
+            header = f.read(16)
+            endian = '<' if header[:2] == b'II' else '>'
+            if header[2:4] in (b'*\x00', b'\x00*'):
+                ifh, offset = header[:8], struct.unpack(endian + 'L', header[4:8])[0]
+            else:
+                ifh, offset = header, struct.unpack(endian + 'Q', header[8:16])[0]  # BigTIFF
+            ifds = []
+            while offset and len(ifds) < 64:
+                f.seek(offset)
+                ifd = TiffImagePlugin.ImageFileDirectory_v2(ifh)
+                ifd.load(f)
+                ifds.append(ifd)
+                offset = ifd.next
+            for offset in ifds[0].get(330, ()):  # overviews stored as SubIFDs
+                f.seek(offset)
+                ifd = TiffImagePlugin.ImageFileDirectory_v2(ifh)
+                ifd.load(f)
+                ifds.append(ifd)
+            base = TiffLevel(ifds[0])
+            levels = [base]
+            for ifd in ifds[1:]:
+                # Later pages count as overviews only if they are the same picture, smaller
+                if not (324 in ifd or 273 in ifd) or ifd.get(262) != ifds[0].get(262):
+                    continue
+                level = TiffLevel(ifd)
+                if level.width < base.width and abs(level.width / base.width - level.height / base.height) < 0.01:
+                    levels.append(level)
+            samples = ifds[0].get(277, 1)
+            if (base.columns * base.rows == 1 and len(levels) == 1
+                    or base.width * base.height * samples < REGION_MIN_MB * 1024 * 1024):
+                f.close()
+                return None  # nothing to gain over a plain decode
+            levels.sort(key=lambda level: -level.width)
+            return cls(path, f, levels, mode)
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            f.close()
+            return None
+
+    def region(self, box, factor=1):
+        """Pixels of box, given in coordinates reduced by `factor`, as an RGB/RGBA image"""
+        w, h = self.size
+        left, top, right, bottom = box
+        x0, x1 = left * factor, min(w, right * factor)
+        y0, y1 = top * factor, min(h, bottom * factor)
+        if x1 <= x0 or y1 <= y0:
+            return Image.new(self.mode, (1, 1))
+        size = (-(-(x1 - x0) // factor), -(-(y1 - y0) // factor))
+
+        # The coarsest stored level that still has a pixel for every output pixel
+        k = 0
+        for i, level in enumerate(self.levels):
+            if w / level.width <= factor * 1.001:
+                k = i
+        level = self.levels[k]
+        sx, sy = level.width / w, level.height / h
+        lx0, ly0, lx1, ly1 = x0 * sx, y0 * sy, x1 * sx, y1 * sy
+        ix0, iy0 = int(lx0), int(ly0)
+        ix1, iy1 = min(level.width, math.ceil(lx1)), min(level.height, math.ceil(ly1))
+
+        tw, th = level.tile_size
+        canvas = Image.new(self.mode, (ix1 - ix0, iy1 - iy0))
+        for row in range(iy0 // th, (iy1 - 1) // th + 1):
+            for col in range(ix0 // tw, (ix1 - 1) // tw + 1):
+                canvas.paste(self._tile(k, col, row), (col * tw - ix0, row * th - iy0))
+        box = (lx0 - ix0, ly0 - iy0, lx1 - ix0, ly1 - iy0)
+        if canvas.size == size and box == (0, 0) + size:
+            return canvas
+        return canvas.resize(size, Image.BOX, box=box)
+
+    def _tile(self, k, col, row):
+        key = (self.path, k, col, row)
+        tile = self.cache.get(key) if self.cache is not None else None
+        if tile is None:
+            start = time.perf_counter()
+            tile = self._decode_tile(self.levels[k], col, row)
+            if self.cache is not None:
+                self.cache.put(key, tile, cost=time.perf_counter() - start)
+        return tile
+
+    def _decode_tile(self, level, col, row):
+        index = row * level.columns + col
+        parts = []
+        with self._lock:
+            for plane in range(level.planes):
+                i = plane * level.columns * level.rows + index
+                self.fp.seek(level.offsets[i])
+                parts.append(self.fp.read(level.counts[i]))
+        # A tile is encoded exactly like a one-strip image of the tile's size
+        rows = level.tile_size[1] if level.tiled else min(level.tile_size[1], level.height - row * level.tile_size[1])
+        ifd = TiffImagePlugin.ImageFileDirectory_v2()
+        for tag in TIFF_TILE_TAGS:
+            if tag in level.ifd:
+                ifd.tagtype[tag] = level.ifd.tagtype[tag]
+                ifd[tag] = level.ifd[tag]
+        ifd[256], ifd[257], ifd[278] = level.tile_size[0], rows, rows
+        ifd.tagtype[273] = ifd.tagtype[279] = TiffTags.LONG
+        ifd[273] = tuple(itertools.accumulate([0] + [len(part) for part in parts[:-1]]))  # relative to the data
+        ifd[279] = tuple(len(part) for part in parts)
+        blob = b'II*\x00' + struct.pack('<L', 8) + ifd.tobytes(8) + b''.join(parts)
+        with Image.open(io.BytesIO(blob)) as tile:
+            return tile.convert(self.mode)
+
+
+class SourceLevel:
+    """One power-of-two level of a region source, read on demand"""
+    def __init__(self, source, factor):
+        self.source = source
+        self.factor = factor
+        self.size = self.width, self.height = (-(-source.size[0] // factor), -(-source.size[1] // factor))
+        self.mode = source.mode
+
+    def region(self, box):
+        return self.source.region(box, self.factor)
+
+
+class SourcePyramid(ImagePyramid):
+    """Pyramid over a region source; no level is ever materialized as a whole"""
+    def __init__(self, source):
+        super().__init__(source, None, None)
+
+    def level(self, k):
+        return SourceLevel(self.base, 1 << k)
+
+
+def open_region_source(path):
+    """A source that can read regions of path without decoding all of it, or None"""
+    source = None
+    if path.lower().endswith(MAPPED_EXTS):
+        source = MappedImage.open(path)
+    if source is None and path.lower().endswith(TIFF_EXTS):
+        source = TiffRegions.open(path)
+    return source
+
+
+def view_matrix(level_size, scaled_size, content_size, degrees, mirrored=False):
+    """Affine coefficients mapping content pixels back onto a source level.
+
+    The view mirrors the level if asked, scales it to scaled_size, rotates it
+    counter-clockwise by `degrees` about its center and centers it in
+    content_size. The result is the inverse of that composition, which is what
+    Image.transform(AFFINE) takes.
+    """
+    lw, lh = level_size
+    kx, ky = scaled_size[0] / lw, scaled_size[1] / lh
+    if degrees % 90 == 0:
+        cos, sin = ((1, 0), (0, 1), (-1, 0), (0, -1))[int(degrees) // 90 % 4]
+    else:
+        rad = math.radians(degrees)
+        cos, sin = math.cos(rad), math.sin(rad)
+    a, b, d, e = cos / kx, -sin / kx, sin / ky, cos / ky
+    cx, cy = content_size[0] / 2, content_size[1] / 2
+    c, f = lw / 2 - a * cx - b * cy, lh / 2 - d * cx - e * cy
+    if mirrored:
+        a, b, c = -a, -b, lw - c
+    return (a, b, c, d, e, f)
+
+
+def decode_image(path, viewport=None):
+    """Decode an image into a display-ready mode.
+
+    With a viewport, decode only as many pixels as needed to cover it:
+    JPEGs use DCT scaling via draft(), other formats an integer reduce().
+    Without one, decode at full resolution.
+    """
+    with tracer.run('decode', path=path):
+        return _decode_image(path, viewport)
+
+
+def _decode_image(path, viewport):
+    start = time.perf_counter()
+    with tracer.span('open'):
+        source = open_region_source(path)
+    if source is not None:
+        orientation = 1
+        if path.lower().endswith(TIFF_EXTS):
+            # Region sources read the pixels as stored, so they need the orientation Pillow would apply
+            with tracer.span('open'), Image.open(path) as src:
+                orientation = exif_orientation(src, stored=True)
+        # Decode only an overview; the renderer reads full-resolution regions on demand
+        factor = max(1, int(1 / cover_scale(source.size, viewport or (SOURCE_OVERVIEW, SOURCE_OVERVIEW))))
+        with tracer.span('region'):
+            img = source.region((0, 0) + SourceLevel(source, factor).size, factor)
+        return DecodedImage(img, source.size, cost=time.perf_counter() - start, source=source,
+                            orientation=orientation)
+    with tracer.span('open'):
+        src = Image.open(path)
+    with src:
+        full_size = src.size
+        # Orientation is applied by the renderer as part of its one resample, never as a pixel copy here
+        orientation = exif_orientation(src)
+        animated = getattr(src, 'is_animated', False)
+        target = None
+        if viewport:
+            scale = cover_scale(full_size, viewport)
+            target = (max(1, math.ceil(full_size[0] * scale)), max(1, math.ceil(full_size[1] * scale)))
+            if src.format == 'JPEG':
+                src.draft(src.mode, target)  # decodes at 1/2, 1/4 or 1/8 size, never below target
+        with tracer.span('decode'):
+            src.load()
+        img = src
+        factor = min(src.width // target[0], src.height // target[1]) if target else 1
+        if factor > 1 and src.mode not in ('P', '1', 'I;16'):
+            # Reduce before converting so the full-size copy is never duplicated
+            with tracer.span('reduce'):
+                img = parallel_reduce(src, factor)
+            factor = 1
+        with tracer.span('convert'):
+            img = img.convert('RGBA') if img.mode in ('RGBA', 'LA', 'P') else img.convert('RGB')
+        if factor > 1:
+            with tracer.span('reduce'):
+                img = parallel_reduce(img, factor)
+    return DecodedImage(img, full_size, cost=time.perf_counter() - start, animated=animated,
+                        orientation=orientation)
+
+
+def available_memory():
+    """Bytes of RAM the OS reports as available, or None where that is unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if sys.platform == 'win32':
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong)] + [
+                (name, ctypes.c_ulonglong) for name in (
+                    'ullTotalPhys', 'ullAvailPhys', 'ullTotalPageFile', 'ullAvailPageFile',
+                    'ullTotalVirtual', 'ullAvailVirtual', 'ullAvailExtendedVirtual')]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+    return None
+
+
+class MemoryManager:
+    """One byte budget shared by every image-derived buffer the viewer keeps.
+
+    Buffers live in named pools (ImageCache). Eviction is GreedyDual-Size:
+    an entry's priority is the inflation value L plus its rebuild cost per
+    byte, refreshed on every hit, and the lowest priority goes first (ties in
+    LRU order), raising L to it. A tile that took a millisecond to resample is
+    dropped long before a full decode of the same size. Pinned entries are
+    counted but never evicted.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self.pools = {}
+        self._entries = {}          # (pool name, key) -> [priority, seq, size, cost, value]
+        self._heap = []             # (priority, seq, ident); stale when seq no longer matches
+        self._pinned = set()
+        self._inflation = 0.0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def trim(self, max_bytes):
+        """Evict until usage is at most max_bytes, e.g. when the OS is low on memory"""
+        with self._lock:
+            self._evict(max_bytes)
+
+    def _touch(self, ident, entry):
+        entry[0] = self._inflation + entry[3] / max(1, entry[2])
+        entry[1] = next(self._seq)
+        heapq.heappush(self._heap, (entry[0], entry[1], ident))
+
+    def _get(self, ident):
+        entry = self._entries.get(ident)
+        if entry is None:
+            return None
+        self._touch(ident, entry)
+        return entry[4]
+
+    def _put(self, ident, value, size, cost):
+        self._remove(ident)
+        entry = self._entries[ident] = [0.0, 0, size, cost, value]
+        self.nbytes += size
+        self.pools[ident[0]].nbytes += size
+        self._touch(ident, entry)
+        self._evict(self.max_bytes)
+
+    def _remove(self, ident):
+        entry = self._entries.pop(ident, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+            self.pools[ident[0]].nbytes -= entry[2]
+        return entry
+
+    def _evict(self, max_bytes):
+        skipped = []
+        while self.nbytes > max_bytes and self._heap:
+            priority, seq, ident = heapq.heappop(self._heap)
+            entry = self._entries.get(ident)
+            if entry is None or entry[1] != seq:
+                continue  # superseded by a later touch
+            if ident in self._pinned:
+                skipped.append((priority, seq, ident))
+                continue
+            self._remove(ident)
+            self._inflation = priority
+            self.evictions += 1
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        # Drop stale heap records once they outnumber live entries
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(e[0], e[1], ident) for ident, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+
+class ImageCache:
+    """A named pool of a MemoryManager, used like a thread-safe dict with eviction.
+
+    Entries report their size via `sizeof` and rebuild cost (seconds) via
+    `costof`, unless put() is given an explicit cost.
+    """
+    def __init__(self, manager, name, sizeof=lambda entry: entry.nbytes, costof=lambda entry: entry.cost):
+        self.manager = manager
+        self.name = name
+        self.sizeof = sizeof
+        self.costof = costof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        manager.pools[name] = self
+
+    def __contains__(self, key):
+        with self.manager._lock:
+            return (self.name, key) in self.manager._entries
+
+    def get(self, key):
+        with self.manager._lock:
+            entry = self.manager._get((self.name, key))
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key, entry, cost=None):
+        size = self.sizeof(entry)
+        cost = self.costof(entry) if cost is None else cost
+        with self.manager._lock:
+            if size > self.manager.max_bytes:
+                self.manager._remove((self.name, key))
+                return
+            self.manager._put((self.name, key), entry, size, cost)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def pin(self, key):
+        """Exempt key from eviction, e.g. the image on screen"""
+        with self.manager._lock:
+            self.manager._pinned.add((self.name, key))
+
+    def unpin(self, key):
+        with self.manager._lock:
+            self.manager._pinned.discard((self.name, key))
+
+    def clear(self):
+        self.discard(lambda key: True)
+
+    def discard(self, match):
+        """Drop every entry whose key satisfies match"""
+        with self.manager._lock:
+            for ident in [ident for ident in self.manager._entries if ident[0] == self.name and match(ident[1])]:
+                self.manager._remove(ident)
+
+
+def file_uri(path):
+    """file:// URI escaped the way GLib does, so thumbnail names match other applications'"""
+    return 'file://' + quote(os.path.abspath(path), safe="/!$&'()*+,:=@")
+
+
+class ThumbnailCache:
+    """On-disk thumbnails following the freedesktop.org spec, generated on a background pool.
+
+    Thumbnails live in ~/.cache/thumbnails/<flavor>/<md5 of URI>.png and are
+    only trusted while their Thumb::MTime matches the file's mtime.
+    """
+    def __init__(self, root=None, max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024, workers=THUMBNAIL_WORKERS,
+                 manifest=None):
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        self.root = root or os.path.join(cache_home, 'thumbnails')
+        self.max_bytes = max_bytes
+        # The thumbnails we wrote, one "<bytes> <path>" line each, so eviction never walks the shared cache
+        self.manifest = manifest or os.path.join(cache_home, 'image-viewer', 'thumbnails.txt')
+        self._manifest_lock = threading.Lock()
+        self._writes = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._pool.submit(self._evict)
+
+    def path_for(self, path, flavor):
+        digest = hashlib.md5(file_uri(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.root, flavor, digest + '.png')
+
+    def lookup(self, path, min_size=None):
+        """Valid thumbnail for path as a DecodedImage, or None.
+
+        Prefers the smallest flavor of at least min_size, and otherwise the largest.
+        """
+        try:
+            mtime = int(os.stat(path).st_mtime)
+        except OSError:
+            return None
+        flavors = list(THUMBNAIL_SIZES)
+        if min_size:
+            flavors = ([f for f in reversed(flavors) if THUMBNAIL_SIZES[f] >= min_size]
+                       + [f for f in flavors if THUMBNAIL_SIZES[f] < min_size])
+        for flavor in flavors:
+            entry = self._load(path, flavor, mtime)
+            if entry is not None:
+                return entry
+        return None
+
+    def generate(self, path, entry):
+        """Queue writing any missing or stale thumbnails for path from an already decoded image"""
+        if not os.path.abspath(path).startswith(self.root + os.sep):
+            self._pool.submit(self._generate, path, entry)
+
+    def _load(self, path, flavor, mtime, pixels=True):
+        try:
+            with Image.open(self.path_for(path, flavor)) as thumb:
+                text = thumb.text
+                if (text.get('Thumb::URI') != file_uri(path)
+                        or int(float(text.get('Thumb::MTime', -1))) != mtime):
+                    return None
+                if not pixels:
+                    return True
+                image = thumb.convert('RGBA') if thumb.mode in ('RGBA', 'LA', 'P') else thumb.convert('RGB')
+            if 'Thumb::Image::Width' in text and 'Thumb::Image::Height' in text:
+                full_size = (int(text['Thumb::Image::Width']), int(text['Thumb::Image::Height']))
+            else:
+                # Not every thumbnailer records the original size; the header has it
+                with Image.open(path) as src:
+                    full_size = src.size
+        except (OSError, ValueError, SyntaxError):
+            return None
+        # Thumbnails are stored upright; some thumbnailers record the stored size regardless
+        if (image.width > image.height) != (full_size[0] > full_size[1]) and image.width != image.height:
+            full_size = full_size[::-1]
+        return DecodedImage(image, full_size)
+
+    def _generate(self, path, entry):
+        try:
+            st = os.stat(path)
+            source = entry.image
+            for flavor, size in THUMBNAIL_SIZES.items():
+                # Each flavor is scaled from the previous one; never upscale a reduced decode
+                ratio = size / max(source.size)
+                if ratio > 1 and not entry.is_full:
+                    continue
+                if ratio < 1:
+                    source = source.resize((max(1, round(source.width * ratio)),
+                                            max(1, round(source.height * ratio))), Image.LANCZOS)
+                if not self._load(path, flavor, int(st.st_mtime), pixels=False):
+                    # Stored upright, as file managers expect, with the size as shown
+                    full_size = entry.full_size[::-1] if ORIENTATIONS[entry.orientation][1] % 180 else entry.full_size
+                    self._write(path, flavor, orient(source, entry.orientation), st, full_size)
+        except OSError:
+            return  # unwritable cache or vanished file: just go without thumbnails
+        self._writes += 1
+        if self._writes % THUMBNAIL_EVICT_EVERY == 0:
+            self._evict()
+
+    def _write(self, path, flavor, thumb, st, full_size):
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Thumb::URI', file_uri(path))
+        info.add_text('Thumb::MTime', str(int(st.st_mtime)))
+        info.add_text('Thumb::Size', str(st.st_size))
+        info.add_text('Thumb::Image::Width', str(full_size[0]))
+        info.add_text('Thumb::Image::Height', str(full_size[1]))
+        info.add_text('Software', THUMBNAIL_SOFTWARE)
+        folder = os.path.join(self.root, flavor)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        # Write to a private temp file and rename, so readers never see a partial PNG
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.png')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                thumb.save(f, 'PNG', pnginfo=info)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self.path_for(path, flavor))
+        except Exception:
+            os.unlink(tmp)
+            raise
+        with self._manifest_lock:
+            os.makedirs(os.path.dirname(self.manifest), mode=0o700, exist_ok=True)
+            with open(self.manifest, 'a', encoding='utf-8') as f:
+                f.write(f'{size} {self.path_for(path, flavor)}\n')
+
+    def _evict(self):
+        """Delete our oldest thumbnails until those we wrote are back under max_bytes.
+
+        Only the files in the manifest are looked at. The cache is shared, so
+        a listed file whose size changed has been rewritten by another
+        application since and is no longer ours to count or delete.
+        """
+        with self._manifest_lock:
+            written = {}
+            try:
+                with open(self.manifest, encoding='utf-8') as f:
+                    for line in f:
+                        size, _, path = line.rstrip('\n').partition(' ')
+                        written[path] = int(size)  # a rewrite of the same thumbnail supersedes the earlier line
+            except (OSError, ValueError):
+                return
+            files = []
+            total = 0
+            for path, size in written.items():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # already gone
+                if st.st_size == size:
+                    files.append((st.st_mtime, size, path))
+                    total += size
+            files.sort()
+            kept = []
+            for mtime, size, path in files:
+                if total > self.max_bytes:
+                    try:
+                        os.unlink(path)
+                        total -= size
+                        continue
+                    except OSError:
+                        pass
+                kept.append(f'{size} {path}\n')
+            # Compact the manifest down to the thumbnails still there
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.manifest), suffix='.txt')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.writelines(kept)
+                os.replace(tmp, self.manifest)
+            except OSError:
+                os.unlink(tmp)
+
+    def forget(self, path):
+        """Delete the stored thumbnails of a file that no longer exists"""
+        for flavor in THUMBNAIL_SIZES:
+            try:
+                os.unlink(self.path_for(path, flavor))
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fit_frame(image, full_size, size, background, orientation=1):
+    """The fit-to-window view of an image as a viewport-sized RGB frame, laid out like the viewer's"""
+    sideways = ORIENTATIONS.get(orientation, (False, 0))[1] % 180
+    if sideways:
+        full_size = full_size[::-1]
+    scale = min(size[0] / full_size[0], size[1] / full_size[1])
+    w, h = max(1, round(full_size[0] * scale)), max(1, round(full_size[1] * scale))
+    img = orient(parallel_resize(image, (h, w) if sideways else (w, h), Image.LANCZOS, reducing_gap=3.0), orientation)
+    frame = Image.new('RGB', size, background)
+    frame.paste(img, (-((w - size[0]) // 2), -((h - size[1]) // 2)), img if img.mode == 'RGBA' else None)
+    return frame
+
+
+def transition_frames(start, end, kind, count):
+    """The in-between frames of a transition from start to end (same-size RGB images)"""
+    frames = []
+    if kind == 'slide':
+        # The new slide pushes the old one out to the left, easing out
+        width = start.width
+        for i in range(1, count + 1):
+            t = i / (count + 1)
+            x = round(width * (1 - (1 - t) ** 2))
+            frame = Image.new('RGB', start.size)
+            frame.paste(start.crop((x, 0, width, start.height)), (0, 0))
+            frame.paste(end.crop((0, 0, x, end.height)), (width - x, 0))
+            frames.append(frame)
+    else:
+        # One vectorized pass per frame over the whole buffer
+        frames = [Image.blend(start, end, i / (count + 1)) for i in range(1, count + 1)]
+    return frames
+
+
+class AnimationPlayer:
+    """Plays an animated GIF/WebP from a bounded buffer of frames rendered ahead on a worker.
+
+    The worker decodes frames in order and resamples each straight into the
+    current view (set_view), so the Tk side only pastes. Frames are shown on
+    a schedule that advances by each frame's own duration from the previous
+    deadline, not from when the callback happened to run, so timer jitter
+    does not accumulate into drift.
+    """
+    def __init__(self, root, path, show, background):
+        self.root = root              # schedules frames: a Tk root, or anything with its after/after_cancel
+        self.path = path
+        self.show = show              # called on the Tk thread with (view, image, box)
+        self.background = background
+        self.view = None              # (view size, window box, content-to-frame affine, quarter turns)
+        self.index = -1               # frame on screen
+        self.started = False
+        self.stats = {'shown': 0, 'stale': 0, 'underruns': 0, 'resyncs': 0}
+        self.buffer = queue.Queue(maxsize=ANIMATION_BUFFER)
+        self._restart_at = None       # frame the worker should continue from after a view change
+        self._due = None
+        self._job = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='animation', daemon=True)
+        self._thread.start()
+
+    def set_view(self, view):
+        """Render upcoming frames for a new view; frames already buffered are dropped"""
+        if view == self.view:
+            return
+        self.view = view
+        self._restart_at = self.index + 1
+        while True:
+            try:
+                self.buffer.get_nowait()
+            except queue.Empty:
+                break
+        if self._job is None and not self._stop.is_set():
+            self._job = self.root.after(ANIMATION_POLL_MS, self._tick)
+
+    def stop(self):
+        self._stop.set()
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        self._job = None
+        if self._stop.is_set():
+            return
+        while True:
+            try:
+                item = self.buffer.get_nowait()
+            except queue.Empty:
+                # Renderer is behind: keep the deadline and check again shortly
+                self.stats['underruns'] += 1
+                self._job = self.root.after(ANIMATION_POLL_MS, self._tick)
+                return
+            if item is None:
+                return  # loop count used up; the last frame stays up
+            view, index, image, duration = item
+            if view == self.view:
+                break
+            self.stats['stale'] += 1
+        self.index = index
+        self.started = True
+        self.stats['shown'] += 1
+        self.show(view, image)
+
+        now = time.perf_counter()
+        self._due = (now if self._due is None else self._due) + duration / 1000
+        if self._due < now:
+            # More than a whole frame late (e.g. the UI was busy): resync instead of racing
+            self.stats['resyncs'] += 1
+            self._due = now
+        self._job = self.root.after(max(0, round((self._due - now) * 1000)), self._tick)
+
+    def _run(self):
+        """Worker: decode, render and buffer frames until stopped or the loop count runs out"""
+        try:
+            with Image.open(self.path) as src:
+                count = getattr(src, 'n_frames', 1)
+                loops = src.info.get('loop')  # None plays once, 0 repeats forever
+                plays = 0
+                index = 0
+                holding = False  # loop count used up: only the last frame is re-rendered
+                recent = OrderedDict()  # index -> (frame, duration); re-rendered after a view change
+                while not self._stop.is_set():
+                    if self._restart_at is not None:
+                        index = count - 1 if holding else self._restart_at % count
+                        self._restart_at = None
+                    view = self.view
+                    if view is None:
+                        time.sleep(ANIMATION_POLL_MS / 1000)
+                        continue
+                    if index in recent:
+                        frame, duration = recent[index]
+                    else:
+                        # Frames just behind the decoder come from `recent`, so a view change
+                        # never forces GIF decoding to restart from frame 0
+                        src.seek(index)
+                        frame = src.copy()
+                        duration = src.info.get('duration') or 0
+                        duration = duration if duration > 10 else ANIMATION_DEFAULT_MS
+                        recent[index] = frame, duration
+                        if len(recent) > ANIMATION_BUFFER + 2:
+                            recent.popitem(last=False)
+                    item = (view, index, self._render(frame, view), duration)
+                    if not self._put(item):
+                        continue  # view changed while waiting; render again from the restart frame
+                    index += 1
+                    if index == count:
+                        index = 0
+                        plays += 1
+                        if holding or loops is None or (loops and plays > loops):
+                            holding = True
+                            self._put(None)
+                            while not self._stop.is_set() and self._restart_at is None:
+                                time.sleep(ANIMATION_POLL_MS / 1000)
+        except Exception:
+            pass  # the first frame stays on screen
+
+    def _put(self, item):
+        """Block until the buffer has room; False if stopped or the view changed meanwhile"""
+        while not self._stop.is_set():
+            if item is not None and self._restart_at is not None:
+                return False
+            try:
+                self.buffer.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _render(self, frame, view):
+        size, box, (a, b, c, d, e, f), turns = view
+        img = frame if frame.mode in ('RGB', 'RGBA') else frame.convert('RGBA')
+        window = (box[2] - box[0], box[3] - box[1])
+        if turns is not None:
+            # Quarter turns (mirrored, angle): resize the matching frame box, then transpose (as tiles do)
+            xs = (c, c + a * window[0] + b * window[1])
+            ys = (f, f + d * window[0] + e * window[1])
+            region = (max(0, min(xs)), max(0, min(ys)), min(img.width, max(xs)), min(img.height, max(ys)))
+            img = img.resize(window[::-1] if turns[1] % 180 else window, Image.BILINEAR, box=region)
+            method = transpose_method(*turns)
+            if method is not None:
+                img = img.transpose(method)
+        else:
+            # Shrinking a lot: reduce first so the bilinear transform sees no aliasing
+            factor = max(1, int(min(math.hypot(a, d), math.hypot(b, e))))
+            if factor > 1:
+                img = img.reduce(factor)
+                a, b, c, d, e, f = (v / factor for v in (a, b, c, d, e, f))
+            img = img.transform(window, Image.AFFINE, (a, b, c, d, e, f), Image.BILINEAR,
+                                fillcolor=self.background if img.mode == 'RGB' else None)
+        if img.mode == 'RGB':
+            return img
+        out = Image.new('RGB', window, self.background)
+        out.paste(img, (0, 0), img)
+        return out
+
+
+class Prefetcher:
+    """Decodes neighbouring images on a worker pool into an ImageCache"""
+    def __init__(self, cache, workers=PREFETCH_WORKERS, on_decoded=None):
+        self.cache = cache
+        self.on_decoded = on_decoded  # called on the worker with (path, entry)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def request(self, paths, viewport=None):
+        """Queue decodes for paths (nearest first), dropping queued work that is no longer wanted"""
+        wanted = set(paths)
+        with self._lock:
+            for path, future in list(self._pending.items()):
+                if path not in wanted and future.cancel():
+                    del self._pending[path]
+            for path in paths:
+                if path not in self._pending and path not in self.cache:
+                    self._pending[path] = self._pool.submit(self._decode, path, viewport)
+
+    def decode(self, path, viewport=None):
+        """Future for a background decode of path, reusing one already queued or running"""
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._pending[path] = self._pool.submit(self._decode, path, viewport)
+        return future
+
+    def redecode(self, path, viewport=None):
+        """Future for a decode of path at a larger size than the one cached, returning the entry"""
+        return self._pool.submit(decode_image, path, viewport)
+
+    def _decode(self, path, viewport):
+        try:
+            if path not in self.cache:
+                entry = decode_image(path, viewport)
+                self.cache.put(path, entry)
+                if self.on_decoded is not None:
+                    self.on_decoded(path, entry)
+        except Exception:
+            pass  # errors are reported when the image is actually shown
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ViewerEngine:
+    """Everything between an image file and the pixels of a viewport, with no toolkit attached.
+
+    Holds the current image, the view state (zoom or fit, rotation, pan
+    center) and the memory-budgeted caches behind them. A front-end changes
+    the state, hands render() a frame buffer the size of its viewport and
+    puts the result on screen however it likes.
+    """
+    def __init__(self, max_cache_mb=MAX_CACHE_MB, background='#000000', thumbnails=True, metadata=True):
+        self.background = background
+        self.screen = None          # decode size for re-decodes past a reduced copy; None decodes in full
+
+        self.memory = MemoryManager(max_cache_mb * 1024 * 1024)
+        self.cache = ImageCache(self.memory, 'decoded')
+        self.tiles = ImageCache(self.memory, 'tiles', sizeof=image_nbytes, costof=lambda tile: 0.0)
+        self.levels = ImageCache(self.memory, 'levels', sizeof=image_nbytes, costof=lambda level: 0.0)
+        self.source_tiles = ImageCache(self.memory, 'source tiles', sizeof=image_nbytes, costof=lambda tile: 0.0)
+        # thumbnails: True for the shared on-disk cache, a ThumbnailCache, or False for none
+        self.thumbnails = ThumbnailCache() if thumbnails is True else thumbnails or None
+        self.prefetcher = Prefetcher(self.cache, on_decoded=self._decoded)
+        # metadata: True for the shared SQLite index, a MetadataIndex, or False for none
+        self.metadata = MetadataIndex() if metadata is True else metadata or None
+
+        self.img = None             # decoded image, possibly reduced (see full_size)
+        self.img_path = None
+        self.full_size = None       # size of the original image
+        self.img_preview = False    # self.img is a stored thumbnail until the real decode lands
+        self.animated = False
+        self.pyramid = None
+        self.source_pyramid = None  # set when the image can be read region by region
+        self._redecode = None       # (path, viewport, future) of a larger decode of the image on its way
+
+        self.zoom = 1.0
+        self.fit_mode = True
+        self.upscale = True         # fit_mode also enlarges images smaller than the viewport
+        self.angle = 0              # quarter turns, counter-clockwise like Image.rotate
+        self.mirrored = False       # flipped left to right before rotating; only EXIF orientation sets it
+        self.orientation = 1        # EXIF orientation of the current image, folded into angle and mirrored
+        self.fine_angle = 0         # extra free rotation on top of angle
+        self.center = [0.5, 0.5]    # view center in normalized image coordinates
+
+    def _decoded(self, path, entry):
+        if self.thumbnails is not None:
+            self.thumbnails.generate(path, entry)
+
+    def decode(self, path, viewport=None):
+        """Decoded image for path from the cache, or decoded here and cached (raises on failure)"""
+        entry = self.cache.get(path)
+        if entry is None:
+            entry = decode_image(path, viewport)
+            self.cache.put(path, entry)
+            self._decoded(path, entry)
+        return entry
+
+    def forget(self, path, deleted=False):
+        """Drop everything cached in memory for path, after the file changed or was deleted"""
+        self.cache.discard(lambda key: key == path)
+        self.tiles.discard(lambda key: key[0] == path)
+        self.levels.discard(lambda key: key[0][0] == path)
+        self.source_tiles.discard(lambda key: key[0] == path)
+        if deleted and self.thumbnails is not None:
+            self.thumbnails.forget(path)
+
+    def set_image(self, path, entry, preview=False):
+        """Make entry (a DecodedImage of path) the image being viewed, keeping the view state"""
+        if path != self.img_path:
+            self.center = [0.5, 0.5]
+            # The image on screen stays resident whatever else is evicted
+            self.cache.unpin(self.img_path)
+            self.cache.pin(path)
+        if entry.orientation != self.orientation:
+            # Swap the base orientation under whatever the user rotated; for the same path
+            # (an upright thumbnail giving way to the stored pixels) the view doesn't move
+            self.angle = (self.angle - ORIENTATIONS[self.orientation][1] + ORIENTATIONS[entry.orientation][1]) % 360
+        self.mirrored = ORIENTATIONS[entry.orientation][0]
+        self.orientation = entry.orientation
+        self.img_preview = preview
+        self.img = entry.image
+        self.img_path = path
+        self.full_size = entry.full_size
+        self.animated = entry.animated
+        self.pyramid = ImagePyramid(entry.image, self.levels, (path, entry.image.size, entry.orientation))
+        self.source_pyramid = None
+        if entry.source is not None:
+            if isinstance(entry.source, TiffRegions):
+                entry.source.cache = self.source_tiles  # mapped reads are served by the OS page cache
+            self.source_pyramid = SourcePyramid(entry.source)
+
+    def close_image(self):
+        """Stop viewing the current image, e.g. when its file was deleted"""
+        self.cache.unpin(self.img_path)
+        self.img = self.img_path = self.full_size = None
+        self.img_preview = self.animated = False
+        self.pyramid = self.source_pyramid = None
+
+    def reset_view(self):
+        self.zoom = 1.0
+        self.angle = ORIENTATIONS[self.orientation][1]  # upright
+        self.fine_angle = 0
+        self.fit_mode = True
+
+    def zoom_by(self, factor):
+        self.fit_mode = False
+        self.zoom = max(0.05, min(self.zoom * factor, 20))
+
+    def fit(self):
+        self.fit_mode = True
+        self.zoom = 1.0
+
+    def rotate(self, degrees):
+        """Quarter-turn rotation by a multiple of 90 degrees"""
+        self.angle = (self.angle + degrees) % 360
+        # Keep the same image point in the middle of the view (PIL rotates counter-clockwise)
+        u, v = self.center
+        for _ in range((degrees // 90) % 4):
+            u, v = v, 1 - u
+        self.center = [u, v]
+
+    @property
+    def rotation(self):
+        """Quarter turns the user added on top of the EXIF orientation"""
+        return (self.angle - ORIENTATIONS[self.orientation][1]) % 360
+
+    @property
+    def display_size(self):
+        """Full size of the current image as shown upright"""
+        return self.full_size[::-1] if ORIENTATIONS[self.orientation][1] % 180 else self.full_size
+
+    def rotate_fine(self, degrees):
+        """Free rotation in small steps; resampled, unlike the lossless quarter turns"""
+        self.fine_angle = (self.fine_angle + degrees + 180) % 360 - 180
+
+    def pan(self, dx, dy, viewport):
+        """Move the view by a distance in viewport pixels"""
+        content_w, content_h = self.content_size(self.display_scale(viewport))
+        self.center[0] += dx / content_w
+        self.center[1] += dy / content_h
+
+    def oriented_size(self, size):
+        """Bounding size of an image of `size` after the current rotation"""
+        w, h = size
+        if self.angle % 180:
+            w, h = h, w
+        if self.fine_angle:
+            a = math.radians(self.fine_angle)
+            w, h = (abs(w * math.cos(a)) + abs(h * math.sin(a)),
+                    abs(w * math.sin(a)) + abs(h * math.cos(a)))
+        return w, h
+
+    def fit_scale(self, viewport):
+        """Scale at which the rotated full-size image just fits the viewport"""
+        full_w, full_h = self.oriented_size(self.full_size)
+        return min(viewport[0] / full_w, viewport[1] / full_h)
+
+    def display_scale(self, viewport):
+        """Scale relative to the full-resolution image"""
+        if not self.fit_mode:
+            return self.zoom
+        scale = self.fit_scale(viewport)
+        return scale if self.upscale else min(1.0, scale)
+
+    def content_size(self, scale):
+        full_w, full_h = self.oriented_size(self.full_size)
+        return max(1, round(full_w * scale)), max(1, round(full_h * scale))
+
+    def view_origin(self, viewport, content):
+        """Top-left of the viewport in content pixels; centered when the image is smaller"""
+        origin = []
+        for i, (view, size) in enumerate(zip(viewport, content)):
+            if size <= view:
+                self.center[i] = 0.5
+                origin.append((size - view) // 2)
+            else:
+                half = view / 2 / size
+                self.center[i] = min(max(self.center[i], half), 1 - half)
+                origin.append(round(self.center[i] * size - view / 2))
+        return origin
+
+    def view_matrix(self, level_size, scale, content):
+        """Fold rotation, zoom/fit scale and centering into one content-to-level affine map"""
+        content_w, content_h = content
+        if self.fine_angle:
+            full_w, full_h = self.full_size
+            scaled = (full_w * scale, full_h * scale)
+        else:
+            # Quarter turns: match the rounded content size exactly so tile edges line up
+            scaled = (content_h, content_w) if self.angle % 180 else (content_w, content_h)
+        return view_matrix(level_size, scaled, content, self.angle + self.fine_angle, self.mirrored)
+
+    @property
+    def redecoding(self):
+        return self._redecode is not None
+
+    def ensure_resolution(self, scale, block=True):
+        """Re-decode the current image if it has fewer pixels than `scale` (relative to full size) needs.
+
+        The decode runs on the prefetch pool. With block=False the current
+        pixels stay in use until finish_redecode() swaps the result in.
+        """
+        if self.img_preview:
+            return  # the real decode is already on its way
+        if self.source_pyramid is not None:
+            return  # regions beyond the overview are read from the source as needed
+        if self.img.width >= self.full_size[0] * scale - 0.5 or self.img.size == self.full_size:
+            return
+        # Cover the whole screen so growing the window doesn't trigger another decode
+        screen = self.screen
+        viewport = screen if screen and scale <= cover_scale(self.full_size, screen) else None
+        pending = self._redecode
+        if pending is None or pending[0] != self.img_path or (pending[1] is not None and viewport is None):
+            pending = self._redecode = (self.img_path, viewport, self.prefetcher.redecode(self.img_path, viewport))
+        if block:
+            wait([pending[2]])
+            self.finish_redecode()
+
+    def finish_redecode(self):
+        """Show the larger decode ensure_resolution started once it is done; True if the image changed"""
+        if self._redecode is None or not self._redecode[2].done():
+            return False
+        path, _, future = self._redecode
+        self._redecode = None
+        if path != self.img_path:
+            return False  # navigation moved on
+        try:
+            entry = future.result()
+        except Exception:
+            return False  # keep showing the reduced copy
+        self.cache.put(path, entry)
+        self.set_image(path, entry)
+        return True
+
+    def animation_view(self, viewport):
+        """The current view in the form AnimationPlayer.set_view takes"""
+        view_w, view_h = viewport
+        scale = self.display_scale(viewport)
+        content_w, content_h = self.content_size(scale)
+        left, top = self.view_origin(viewport, (content_w, content_h))
+        box = (max(0, -left), max(0, -top), min(view_w, content_w - left), min(view_h, content_h - top))
+        a, b, c, d, e, f = self.view_matrix(self.full_size, scale, (content_w, content_h))
+        x, y = left + box[0], top + box[1]
+        return ((view_w, view_h), box, (a, b, c + a * x + b * y, d, e, f + d * x + e * y),
+                None if self.fine_angle else (self.mirrored, self.angle))
+
+    def render(self, frame, refine_budget=None):
+        """Compose the visible tiles into frame and return how many are still at preview quality.
+
+        frame is an RGB image the size of the viewport, already cleared to the
+        background. With refine_budget=None every tile is resampled with
+        LANCZOS; otherwise LANCZOS tiles are produced only for that many
+        seconds and the rest fall back to FAST_RESAMPLE, and a re-decode the
+        zoom needs is left running (see finish_redecode).
+        """
+        if self.img is None:
+            return 0
+        view_w, view_h = frame.size
+        scale = self.display_scale(frame.size)
+
+        # Decode more pixels only once the reduced copy is no longer enough; a
+        # budgeted render upscales what it has until they arrive
+        with tracer.span('ensure_resolution'):
+            self.ensure_resolution(scale, block=refine_budget is None)
+
+        # Whole image at this scale; only the tiles inside the viewport are resampled,
+        # from the nearest pyramid level that still has enough pixels
+        content_w, content_h = self.content_size(scale)
+        pyramid, base_size = self.pyramid, self.img.size
+        if self.source_pyramid is not None and content_w > self.oriented_size(base_size)[0]:
+            pyramid, base_size = self.source_pyramid, self.full_size  # overview is too coarse
+        level = pyramid.level(pyramid.level_for(content_w / self.oriented_size(base_size)[0]))
+        matrix = self.view_matrix(level.size, scale, (content_w, content_h))
+        left, top = self.view_origin(frame.size, (content_w, content_h))
+        key = (self.img_path, base_size, self.mirrored, self.angle, self.fine_angle, content_w, content_h)
+
+        deadline = None if refine_budget is None else time.perf_counter() + refine_budget
+        cells = [(tx, ty) for ty in range(max(0, top) // TILE_SIZE, (min(content_h, top + view_h) - 1) // TILE_SIZE + 1)
+                 for tx in range(max(0, left) // TILE_SIZE, (min(content_w, left + view_w) - 1) // TILE_SIZE + 1)]
+        fresh = {}
+        missing = [cell for cell in cells if key + cell not in self.tiles]
+        if resample_pool is not None and missing:
+            # Resample the missing tiles on all cores; with a budget, one batch per
+            # worker round so the deadline is checked between batches
+            def resample(cell):
+                start = time.perf_counter()
+                tile = self.render_tile(level, matrix, content_w, content_h, cell[0], cell[1], fast=False)
+                return tile, time.perf_counter() - start
+
+            batch = len(missing) if deadline is None else RESAMPLE_WORKERS
+            for i in range(0, len(missing), batch):
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                cells_batch = missing[i:i + batch]
+                with tracer.span('tiles', count=len(cells_batch)):
+                    for cell, (tile, cost) in zip(cells_batch, resample_pool.map(resample, cells_batch)):
+                        self.tiles.put(key + cell, tile, cost=cost)
+                        fresh[cell] = tile
+        previews = 0
+        for tx, ty in cells:
+            tile = fresh.pop((tx, ty), None)
+            if tile is None:
+                tile = self.tiles.get(key + (tx, ty))
+            if tile is None and resample_pool is None and (deadline is None or time.perf_counter() < deadline):
+                start = time.perf_counter()
+                tile = self.render_tile(level, matrix, content_w, content_h, tx, ty, fast=False)
+                self.tiles.put(key + (tx, ty), tile, cost=time.perf_counter() - start)
+            elif tile is None:
+                previews += 1
+                tile = self.tiles.get(key + (tx, ty, 'fast'))
+                if tile is None:
+                    start = time.perf_counter()
+                    tile = self.render_tile(level, matrix, content_w, content_h, tx, ty, fast=True)
+                    self.tiles.put(key + (tx, ty, 'fast'), tile, cost=time.perf_counter() - start)
+            with tracer.span('compose'):
+                frame.paste(tile, (tx * TILE_SIZE - left, ty * TILE_SIZE - top),
+                            tile if tile.mode == 'RGBA' else None)
+        return previews
+
+    def render_frame(self, viewport, refine_budget=None):
+        """A new viewport-sized frame of the current view"""
+        frame = Image.new('RGB', viewport, self.background)
+        self.render(frame, refine_budget)
+        return frame
+
+    def render_tile(self, level, matrix, content_w, content_h, tx, ty, fast):
+        """Produce one TILE_SIZE cell of the view from a source level in a single resample.
+
+        Pan is applied afterwards as an integer offset when tiles are placed,
+        so a tile stays valid while the view scrolls over it.
+        """
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        size = (min(TILE_SIZE, content_w - x0), min(TILE_SIZE, content_h - y0))
+        a, b, c, d, e, f = matrix
+        c, f = c + a * x0 + b * y0, f + d * x0 + e * y0
+        if isinstance(level, SourceLevel):
+            # Read just the source pixels under this tile and render from that patch
+            xs = [c + a * x + b * y for x, y in ((0, 0), (size[0], 0), (0, size[1]), size)]
+            ys = [f + d * x + e * y for x, y in ((0, 0), (size[0], 0), (0, size[1]), size)]
+            box = (max(0, math.floor(min(xs)) - SOURCE_PAD), max(0, math.floor(min(ys)) - SOURCE_PAD),
+                   min(level.width, math.ceil(max(xs)) + SOURCE_PAD), min(level.height, math.ceil(max(ys)) + SOURCE_PAD))
+            with tracer.span('region'):
+                level = level.region(box)
+            c, f = c - box[0], f - box[1]
+        if self.fine_angle:
+            with tracer.span('rotate'):
+                return level.transform(size, Image.AFFINE, (a, b, c, d, e, f),
+                                       FAST_RESAMPLE if fast else FREE_RESAMPLE,
+                                       fillcolor=self.background if level.mode == 'RGB' else None)
+        # Axis-aligned: resample the matching source box with a proper filter, then
+        # transpose the tile itself, which is exact and only tile-sized
+        xs = (c, c + a * size[0] + b * size[1])
+        ys = (f, f + d * size[0] + e * size[1])
+        box = (max(0, min(xs)), max(0, min(ys)), min(level.width, max(xs)), min(level.height, max(ys)))
+        with tracer.span('resize'):
+            tile = level.resize(size[::-1] if self.angle % 180 else size,
+                                FAST_RESAMPLE if fast else Image.LANCZOS, box=box)
+        method = transpose_method(self.mirrored, self.angle)
+        if method is None:
+            return tile
+        with tracer.span('rotate'):
+            return tile.transpose(method)
+
+    def hud_text(self, counters=None):
+        """Per-stage milliseconds of the latest load, frame and decode, cache hit ratios,
+        and any counters the front-end passes as a {name: value} dict"""
+        lines = []
+        for run in ('load', 'frame', 'decode'):
+            stages = tracer.last.get(run)
+            if stages:
+                lines.append(f'{run:<20}{stages["total"]:7.1f} ms')
+                lines += [f'  {stage:<18}{ms:7.1f}' for stage, ms in
+                          sorted(stages.items(), key=lambda item: -item[1]) if stage != 'total']
+        for name, pool in self.memory.pools.items():
+            if pool.hits + pool.misses:
+                lines.append(f'{name + " hits":<20}{pool.hit_ratio:7.0%}')
+        lines.append(f'{"cache MB":<20}{self.memory.nbytes / 2**20:7.1f}')
+        lines.append(f'{"cache evictions":<20}{self.memory.evictions:7d}')
+        for name, value in (counters or {}).items():
+            lines.append(f'{name:<20}{value:>7}')
+        return '\n'.join(lines)
+
+    def shutdown(self):
+        self.prefetcher.shutdown()
+        if self.thumbnails is not None:
+            self.thumbnails.shutdown()
+        if self.metadata is not None:
+            self.metadata.shutdown()